@@ -1,5 +1,39 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .auth import invalidate_user
+        from .database import check_connections, on_connection_created
+        from .metrics import install_query_wrapper
+        from .sessions import flush_sessions, start_request
+        connection_created.connect(
+            install_query_wrapper, dispatch_uid='core_metrics_queries'
+        )
+        connection_created.connect(
+            on_connection_created, dispatch_uid='core_connection_setup'
+        )
+        request_started.connect(
+            check_connections, dispatch_uid='core_connection_checks'
+        )
+        request_started.connect(
+            start_request, dispatch_uid='core_session_requests'
+        )
+        request_finished.connect(
+            flush_sessions, dispatch_uid='core_flush_sessions'
+        )
+        user_model = get_user_model()
+        post_save.connect(
+            invalidate_user, sender=user_model,
+            dispatch_uid='core_invalidate_user_save',
+        )
+        post_delete.connect(
+            invalidate_user, sender=user_model,
+            dispatch_uid='core_invalidate_user_delete',
+        )
@@ -0,0 +1,159 @@
+"""Двухуровневый кэш, версии пространств ключей и защита от штормов.
+
+TieredCache - бэкенд для CACHES['default']: сначала читает L1 в памяти
+процесса, при промахе - общий для всех воркеров L2 и кладёт найденное
+в L1 на LOCAL_TIMEOUT секунд. Запись и удаление идут в оба уровня,
+поэтому в своём процессе изменения видны сразу, а в чужих - не позже
+чем через LOCAL_TIMEOUT. Через него работают все кэши проекта:
+страницы, фрагменты {% cache %}, ключи sorl-thumbnail.
+
+get_version()/bump_version() - счётчики версий: данные помечаются
+версией, и её увеличение разом делает устаревшими все значения
+пространства без перебора ключей.
+
+cached() защищает от шторма при промахе: пересчитывает значение только
+тот, кто взял блокировку, остальные в это время получают устаревшее
+значение, а если его нет - ждут готового. Блокировка - это add() в L2,
+поэтому защита работает между процессами, только если L2 - настоящий
+общий кэш с атомарным add() (memcached, Redis). FileBasedCache и
+LocMemCache атомарны лишь внутри процесса.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_missing = object()
+
+
+class TieredCache(BaseCache):
+    """L1 + L2 поверх двух других алиасов CACHES.
+
+    OPTIONS: LOCAL и SHARED - алиасы уровней, LOCAL_TIMEOUT - сколько
+    секунд значение живёт в L1. Ключи и версии передаются уровням как
+    есть, префиксы и VERSION задаются в их собственных настройках.
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self.local_alias = options.get('LOCAL', 'local')
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 1)
+
+    @property
+    def local(self):
+        return caches[self.local_alias]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self.local.delete(key, version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(key, _missing, version)
+        if value is _missing:
+            value = self.shared.get(key, _missing, version)
+            if value is _missing:
+                return default
+            self.local.set(key, value, self.local_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self.local.set(key, value, self._local_timeout(timeout), version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version)
+        return self.shared.delete(key, version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version) is not _missing
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        self.local.delete(key, version)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def _version_key(name):
+    return f'core:version:{name}'
+
+
+def get_version(name):
+    """Текущая версия пространства ключей name."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Начинаем со времени, чтобы после вытеснения ключа версия
+        # не совпала с одной из уже использованных.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Делает устаревшими все значения пространства name."""
+    try:
+        cache.incr(_version_key(name))
+    except ValueError:
+        get_version(name)
+
+
+def cached(key, compute, timeout, version=None):
+    """Значение из кэша или compute(), пересчитанное одним процессом.
+
+    Значение хранится вместе с версией и сроком свежести ещё
+    CACHE_STALE_SECONDS после него. Если оно устарело по сроку или
+    версии, пересчитывает тот, кто первым взял блокировку, а остальные
+    получают старое значение. Если значения нет совсем, остальные ждут
+    до CACHE_LOCK_SECONDS и только потом считают сами. Блокировка
+    надёжна, только если add() общего кэша атомарен.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        entry_version, fresh_until, value = entry
+        if entry_version == version and time.time() < fresh_until:
+            return value
+    lock = f'{key}:lock'
+    if cache.add(lock, 1, settings.CACHE_LOCK_SECONDS):
+        try:
+            value = compute()
+            cache.set(
+                key,
+                (version, time.time() + timeout, value),
+                timeout + settings.CACHE_STALE_SECONDS,
+            )
+        finally:
+            cache.delete(lock)
+        return value
+    if entry is not None:
+        return entry[2]
+    deadline = time.monotonic() + settings.CACHE_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[2]
+    return compute()
@@ -0,0 +1,112 @@
+"""Количество строк выборок без COUNT(*) на каждый запрос.
+
+count() возвращает пару (количество, точно ли оно). Для небольших
+выборок это COUNT(*), который считается одним процессом и живёт в
+кэше COUNT_CACHE_SECONDS. Если статистика планировщика оценивает
+выборку хотя бы в COUNT_ESTIMATE_MIN строк, отдаётся оценка: COUNT(*)
+по такой таблице - полный проход. exact_count() всегда точный, но тоже
+кэшируется.
+
+Ключ кэша - SQL выборки, поверх - версия модели: invalidate(model)
+при создании и удалении строк сбрасывает все её количества разом.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import DatabaseError, connections, transaction
+
+from .cache import bump_version, cached, get_version
+
+
+def _namespace(model):
+    return f'counts:{model._meta.label_lower}'
+
+
+def invalidate(model):
+    """Делает устаревшими все закэшированные количества модели."""
+    bump_version(_namespace(model))
+
+
+def _key(queryset, kind):
+    sql = str(queryset.order_by().query)
+    digest = hashlib.md5(f'{queryset.db}:{sql}'.encode()).hexdigest()
+    return f'core:count:{kind}:{digest}'
+
+
+def _sqlite_estimate(queryset, connection):
+    # Без ANALYZE таблицы sqlite_stat1 нет, а строка в ней знает только
+    # размер таблицы - подходит лишь для выборок без условий.
+    if queryset.query.where:
+        return None
+    try:
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return int(row[0].split()[0]) if row else None
+
+
+def _postgres_estimate(queryset, connection):
+    # explain() в Django 3.2 отдаёт str() плана, который psycopg2 уже
+    # разобрал из JSON, поэтому EXPLAIN выполняется напрямую.
+    sql, params = queryset.order_by().query.get_compiler(
+        queryset.db
+    ).as_sql()
+    try:
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+    except DatabaseError:
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate(queryset):
+    """Оценка числа строк по статистике планировщика или None."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        return _postgres_estimate(queryset, connection)
+    if connection.vendor == 'sqlite':
+        return _sqlite_estimate(queryset, connection)
+    return None
+
+
+def count(queryset):
+    """(количество, точно ли оно) выборки queryset."""
+    try:
+        key = _key(queryset, 'any')
+    except EmptyResultSet:
+        return 0, True
+
+    def compute():
+        estimated = estimate(queryset)
+        if estimated is not None and estimated >= settings.COUNT_ESTIMATE_MIN:
+            return estimated, False
+        return queryset.count(), True
+
+    return cached(
+        key, compute, settings.COUNT_CACHE_SECONDS,
+        version=get_version(_namespace(queryset.model)),
+    )
+
+
+def exact_count(queryset):
+    """Точное количество строк, посчитанное не чаще раза в TTL."""
+    total, exact = count(queryset)
+    if exact:
+        return total
+    return cached(
+        _key(queryset, 'exact'), queryset.count,
+        settings.COUNT_CACHE_SECONDS,
+        version=get_version(_namespace(queryset.model)),
+    )
@@ -0,0 +1,30 @@
+"""Настройка соединений с базой: PRAGMA для SQLite и проверка
+постоянных соединений перед запросом."""
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+
+def on_connection_created(sender, connection, **kwargs):
+    """Обработчик connection_created."""
+    metrics.CONNECTIONS.inc(connection.alias)
+    if connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS:
+        with connection.cursor() as cursor:
+            for name, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def check_connections(**kwargs):
+    """Обработчик request_started: закрывает оборванные соединения.
+
+    Django 3.2 проверяет соединение, только если в нём уже была ошибка,
+    и при CONN_MAX_AGE запрос мог бы получить соединение, которое сервер
+    базы закрыл по таймауту. Закрытое откроется заново при первом
+    запросе к базе.
+    """
+    if not settings.CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
@@ -0,0 +1,50 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def copy_database(source_name, target_name):
+    """Копия файла SQLite через backup API: согласованный снимок даже
+    при идущих записях."""
+    with closing(sqlite3.connect(source_name)) as source, \
+            closing(sqlite3.connect(target_name)) as target:
+        source.backup(target)
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики из DATABASE_REPLICAS. '
+        'Заменяет репликацию при локальной проверке.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять копирование каждые N секунд; 0 - один раз.',
+        )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены: YATUBE_DB_REPLICAS.')
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError(
+                'Копирование работает только для SQLite, для остальных '
+                'баз нужна настоящая репликация.'
+            )
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(
+                    primary['NAME'], settings.DATABASES[alias]['NAME']
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Реплик обновлено: {len(settings.DATABASE_REPLICAS)}'
+            ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
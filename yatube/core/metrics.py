@@ -0,0 +1,204 @@
+"""Метрики запросов: гистограммы по имени представления.
+
+Во время запроса в contextvar лежит RequestStats, куда обёртка
+выполнения SQL, шаблонный бэкенд и миниатюры складывают время и число
+запросов. contextvar переходит и в потоки sync_to_async, поэтому
+async-представления учитываются так же. После ответа значения
+попадают в гистограммы процесса, которые отдаёт /metrics в формате
+Prometheus. У каждого процесса-воркера свои гистограммы.
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf,
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, math.inf)
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Счётчики одного запроса."""
+    __slots__ = ('queries', 'sql', 'template', 'thumbnail')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.thumbnail = 0.0
+
+
+def start_request():
+    """Начинает сбор; возвращает статистику и токен для finish_request."""
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timer(kind):
+    """Добавляет время блока к полю kind статистики текущего запроса."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            stats, kind, getattr(stats, kind) + time.perf_counter() - start
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL (connection.execute_wrapper)."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql += time.perf_counter() - start
+        stats.queries += 1
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created: подключает record_query."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """Кумулятивная гистограмма с метками, как в Prometheus."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            counts, total = self.series.get(
+                label, ([0] * len(self.buckets), 0.0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[label] = (counts, total + value)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted(
+                (label, list(counts), total)
+                for label, (counts, total) in self.series.items()
+            )
+        for label, counts, total in series:
+            view = _escape(label)
+            for bound, count in zip(self.buckets, counts):
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                lines.append(
+                    f'{self.name}_bucket{{view="{view}",le="{le}"}} {count}'
+                )
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {counts[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label='view'):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, label):
+        with self.lock:
+            self.series[label] = self.series.get(label, 0) + 1
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self.lock:
+            series = sorted(self.series.items())
+        for label, value in series:
+            lines.append(
+                f'{self.name}{{{self.label}="{_escape(label)}"}} {value}'
+            )
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+DURATION = Histogram(
+    'yatube_request_duration_seconds',
+    'Полное время обработки запроса.',
+    LATENCY_BUCKETS,
+)
+SQL_TIME = Histogram(
+    'yatube_request_sql_seconds',
+    'Время SQL-запросов за один запрос.',
+    LATENCY_BUCKETS,
+)
+TEMPLATE_TIME = Histogram(
+    'yatube_request_template_seconds',
+    'Время рендера шаблонов, включая запросы и миниатюры внутри.',
+    LATENCY_BUCKETS,
+)
+THUMBNAIL_TIME = Histogram(
+    'yatube_request_thumbnail_seconds',
+    'Время поиска миниатюр и вариантов картинок.',
+    LATENCY_BUCKETS,
+)
+QUERIES = Histogram(
+    'yatube_request_queries',
+    'Число SQL-запросов за один запрос.',
+    QUERY_BUCKETS,
+)
+SLOW_REQUESTS = Counter(
+    'yatube_slow_requests_total',
+    'Запросы дольше SLOW_REQUEST_SECONDS.',
+)
+CONNECTIONS = Counter(
+    'yatube_db_connections_total',
+    'Открытые соединения с базой; при CONN_MAX_AGE растёт медленно.',
+    label='alias',
+)
+METRICS = (
+    DURATION, SQL_TIME, TEMPLATE_TIME, THUMBNAIL_TIME, QUERIES,
+    SLOW_REQUESTS, CONNECTIONS,
+)
+
+
+def observe(view, stats, duration):
+    DURATION.observe(view, duration)
+    SQL_TIME.observe(view, stats.sql)
+    TEMPLATE_TIME.observe(view, stats.template)
+    THUMBNAIL_TIME.observe(view, stats.thumbnail)
+    QUERIES.observe(view, stats.queries)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
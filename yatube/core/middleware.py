@@ -0,0 +1,275 @@
+import logging
+import random
+import time
+
+from asgiref.sync import (
+    async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async,
+)
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import metrics, page_cache, profiling, replicas
+
+logger = logging.getLogger('core.metrics')
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запроса и пишет в лог медленные запросы.
+
+    Ставится первым в MIDDLEWARE, чтобы время включало остальные
+    middleware. Работает и под WSGI, и под ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, duration):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        metrics.observe(view, stats, duration)
+        if duration > settings.SLOW_REQUEST_SECONDS:
+            metrics.SLOW_REQUESTS.inc(view)
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.0f мс, SQL %d за %.0f мс, '
+                'шаблоны %.0f мс, миниатюры %.0f мс, статус %s',
+                request.method, request.get_full_path(), view,
+                duration * 1000, stats.queries, stats.sql * 1000,
+                stats.template * 1000, stats.thumbnail * 1000,
+                response.status_code,
+            )
+
+
+class SamplingProfilerMiddleware:
+    """Профилирует долю запросов PROFILE_SAMPLE_RATE, см. profiling.
+
+    Снимаются стеки только потока запроса, поэтому под ASGI у
+    async-представлений видна лишь синхронная часть цепочки. При
+    нулевой доле middleware отключается при старте и ничего не стоит.
+
+    Стоит до PageCacheMiddleware и AnonymousFastPathMiddleware: они
+    отвечают, не доходя до process_view, поэтому адрес разбирается
+    здесь же.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return self.get_response(request)
+        try:
+            view = resolve(request.path_info).view_name
+        except Resolver404:
+            view = '<unresolved>'
+        profiling.start(view, settings.PROFILE_INTERVAL)
+        try:
+            return self.get_response(request)
+        finally:
+            profiling.stop()
+
+
+class ReplicaRoutingMiddleware:
+    """Направляет чтения представлений на реплики, см. replicas."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = replicas.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            replicas.finish_request(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        state, token = replicas.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            replicas.finish_request(token)
+        return self.pin(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas.route_view(request, view_func)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class AnonymousFastPathMiddleware:
+    """Анонимные GET к ANONYMOUS_FAST_PATH_VIEWS в обход сессий, CSRF и
+    сообщений.
+
+    Без cookie сессии пользователь заведомо аноним: представление
+    вызывается сразу с AnonymousUser, а остальные middleware пропускаются.
+    Ответ 200 без cookie помечается Cache-Control: public, и с
+    Vary: Cookie прокси или кэш страниц отдают его только запросам без
+    cookie.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def match(self, request):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or settings.SESSION_COOKIE_NAME in request.COOKIES
+        ):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.view_name not in settings.ANONYMOUS_FAST_PATH_VIEWS:
+            return None
+        request.resolver_match = match
+        request.user = AnonymousUser()
+        replicas.route_view(request, match.func)
+        return match
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        match = self.match(request)
+        if match is None:
+            return self.get_response(request)
+        view = match.func
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        response = view(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        return self.publish(response)
+
+    async def __acall__(self, request):
+        match = self.match(request)
+        if match is None:
+            return await self.get_response(request)
+        view = match.func
+        if not iscoroutinefunction(view):
+            view = sync_to_async(view, thread_sensitive=True)
+        response = await view(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = await sync_to_async(
+                response.render, thread_sensitive=True
+            )()
+        return self.publish(response)
+
+    def publish(self, response):
+        if response.status_code == 200 and not response.cookies:
+            patch_cache_control(
+                response, public=True,
+                max_age=settings.ANONYMOUS_CACHE_SECONDS,
+            )
+        patch_vary_headers(response, ('Cookie',))
+        # XFrameOptionsMiddleware тоже пропущен.
+        response.setdefault('X-Frame-Options', settings.X_FRAME_OPTIONS)
+        return response
+
+
+class PageCacheMiddleware:
+    """Отдаёт и сохраняет страницы анонимов, см. page_cache.
+
+    Стоит перед AnonymousFastPathMiddleware и кэширует только то, что
+    тот пометил как публичное.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def cacheable(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        )
+
+    def hit(self, request, response):
+        # Для метрик: страница из кэша считается под своим именем URL.
+        try:
+            request.resolver_match = resolve(request.path_info)
+        except Resolver404:
+            pass
+        response['X-Page-Cache'] = 'hit'
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.cacheable(request):
+            return self.get_response(request)
+        response = page_cache.get_page(request)
+        if response is not None:
+            return self.hit(request, response)
+        started = time.time()
+        response = self.get_response(request)
+        page_cache.store_page(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.cacheable(request):
+            return await self.get_response(request)
+        response = await sync_to_async(
+            page_cache.get_page, thread_sensitive=False
+        )(request)
+        if response is not None:
+            return self.hit(request, response)
+        started = time.time()
+        response = await self.get_response(request)
+        await sync_to_async(
+            page_cache.store_page, thread_sensitive=False
+        )(request, response, started)
+        return response
@@ -0,0 +1,161 @@
+"""Кэш целых страниц с суррогатными ключами.
+
+Представление помечает ответ ключами (add_surrogate_keys), например
+post:5, group:cats, author:leo; они уходят в заголовок Surrogate-Key.
+PageCacheMiddleware сохраняет публичные ответы анонимам вместе с
+версиями их ключей и при чтении сверяет версии: purge() увеличивает
+версию ключа, и все страницы с ним перестают отдаваться из кэша.
+Кроме своих ключей каждая страница помечена ключом all. Страница,
+во время построения которой сбросили один из её ключей, в кэш не
+кладётся; сбросы чужих ключей ей не мешают.
+
+purge() срабатывает сразу и ещё раз после коммита транзакции, чтобы
+параллельный запрос не оставил в кэше страницу, прочитанную до
+изменения. После коммита ключи также пересылаются на адреса
+PAGE_CACHE_PURGE_URLS - так сбрасывается кэширующий прокси или другой
+экземпляр сайта (см. core.views.purge).
+"""
+import hashlib
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .cache import bump_version, get_version
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Surrogate-Key'
+ALL = 'all'
+# Заголовки, которые сохраняются вместе со страницей.
+STORED_HEADERS = (
+    'Content-Type', 'Cache-Control', 'Vary', 'X-Frame-Options', HEADER,
+)
+
+
+def _tag(key):
+    return f'page:{key}'
+
+
+def _purged(key):
+    return f'core:page_purged:{key}'
+
+
+def normalize(key):
+    """Ключ, безопасный для заголовка: не-ASCII кодируется как в URL."""
+    return quote(str(key), safe=':')
+
+
+def add_surrogate_keys(response, *keys):
+    keys = [normalize(key) for key in keys]
+    existing = response.get(HEADER, '').split()
+    response[HEADER] = ' '.join(dict.fromkeys(existing + keys))
+    return response
+
+
+def _page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'core:page:{path}'
+
+
+def _versions(keys):
+    return tuple(get_version(_tag(key)) for key in keys)
+
+
+def get_page(request):
+    entry = cache.get(_page_key(request))
+    if entry is None:
+        return None
+    keys, versions, status, headers, content = entry
+    if _versions(keys) != versions:
+        return None
+    response = HttpResponse(content, status=status)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def store_page(request, response, started):
+    """Кладёт в кэш публичный ответ 200 без cookie с суррогатными
+    ключами, если ни один из них не сбрасывали после started."""
+    if (
+        response.status_code != 200
+        or response.cookies
+        or response.streaming
+        or HEADER not in response
+        or 'public' not in response.get('Cache-Control', '')
+    ):
+        return
+    keys = (ALL, *response[HEADER].split())
+    purged = cache.get_many([_purged(key) for key in keys])
+    if any(when >= started for when in purged.values()):
+        return
+    headers = [
+        (name, response[name]) for name in STORED_HEADERS if name in response
+    ]
+    cache.set(
+        _page_key(request),
+        (keys, _versions(keys), response.status_code, headers,
+         response.content),
+        settings.PAGE_CACHE_SECONDS,
+    )
+
+
+def _bump(keys):
+    now = time.time()
+    for key in keys:
+        bump_version(_tag(key))
+        cache.set(_purged(key), now, settings.PAGE_CACHE_SECONDS)
+
+
+def purge_now(*keys):
+    """Сразу сбрасывает страницы с ключами keys в этом кэше."""
+    _bump(normalize(key) for key in keys)
+
+
+def purge_header(value):
+    """Сбрасывает ключи из заголовка Surrogate-Key, без пересылки."""
+    _bump(value.split())
+
+
+def _forward(keys):
+    header = ' '.join(normalize(key) for key in keys)
+    for url in settings.PAGE_CACHE_PURGE_URLS:
+        request = urllib.request.Request(
+            url, method='POST', headers={HEADER: header}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=2):
+                pass
+        except (urllib.error.URLError, OSError) as error:
+            logger.warning('Не удалось сбросить %s на %s: %s',
+                           header, url, error)
+
+
+def _purge(keys):
+    purge_now(*keys)
+    if settings.PAGE_CACHE_PURGE_URLS:
+        threading.Thread(target=_forward, args=(keys,), daemon=True).start()
+
+
+def purge(*keys):
+    """Сбрасывает страницы с ключами keys сразу и ещё раз после коммита.
+
+    Первый сброс нужен, чтобы изменения сразу видел код в той же
+    транзакции, второй - чтобы не осталась страница, которую другой
+    запрос успел построить по данным до коммита.
+    """
+    if keys:
+        purge_now(*keys)
+        transaction.on_commit(lambda: _purge(keys))
+
+
+def purge_all():
+    purge(ALL)
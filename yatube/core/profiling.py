@@ -0,0 +1,105 @@
+"""Выборочный профилировщик запросов.
+
+Middleware профилирует долю запросов PROFILE_SAMPLE_RATE: поток,
+который обрабатывает запрос, регистрируется под именем URL, а фоновый
+поток раз в PROFILE_INTERVAL секунд снимает стеки всех
+зарегистрированных потоков через sys._current_frames(). Стеки
+копятся в памяти процесса в свёрнутом формате (collapsed stacks),
+который понимают flamegraph.pl и speedscope.
+
+Сигнальный таймер (setitimer) не подходит: он срабатывает только в
+главном потоке, а запросы обслуживаются в рабочих потоках сервера.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+_lock = threading.Lock()
+_active = {}
+_stacks = {}
+_sampler = None
+
+
+def _frame_name(frame):
+    module = frame.f_globals.get('__name__', '?')
+    return f'{module}:{frame.f_code.co_name}'
+
+
+def collapse(frame):
+    """Стек кадра от корня к листу через ';'."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def sample():
+    """Один снимок стеков всех профилируемых потоков."""
+    with _lock:
+        active = dict(_active)
+    if not active:
+        return
+    frames = sys._current_frames()
+    with _lock:
+        for thread_id, view in active.items():
+            frame = frames.get(thread_id)
+            if frame is not None:
+                _stacks.setdefault(view, Counter())[collapse(frame)] += 1
+
+
+def _run(interval):
+    while True:
+        time.sleep(interval)
+        sample()
+
+
+def _ensure_sampler(interval):
+    global _sampler
+    with _lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = threading.Thread(
+                target=_run, args=(interval,), name='yatube-profiler',
+                daemon=True,
+            )
+            _sampler.start()
+
+
+def start(view, interval):
+    """Начинает профилировать текущий поток под именем view."""
+    _ensure_sampler(interval)
+    with _lock:
+        _active[threading.get_ident()] = view
+
+
+def stop():
+    with _lock:
+        _active.pop(threading.get_ident(), None)
+
+
+def views():
+    """{имя URL: число снимков}."""
+    with _lock:
+        return {
+            view: sum(stacks.values()) for view, stacks in _stacks.items()
+        }
+
+
+def collapsed(view=None):
+    """Строки 'имя URL;кадр;...;кадр число' для флейм-графа."""
+    with _lock:
+        items = [
+            (name, dict(stacks)) for name, stacks in _stacks.items()
+            if view is None or name == view
+        ]
+    lines = []
+    for name, stacks in sorted(items):
+        for stack, count in sorted(stacks.items()):
+            lines.append(f'{name};{stack} {count}')
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def reset():
+    with _lock:
+        _stacks.clear()
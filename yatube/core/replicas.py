@@ -0,0 +1,84 @@
+"""Чтение с реплик базы.
+
+ReplicaRoutingMiddleware решает для каждого запроса, можно ли читать
+с реплики: да для GET и HEAD к представлениям из REPLICA_VIEW_MODULES,
+если представление не помечено use_primary и у клиента нет метки
+REPLICA_PIN_COOKIE. Решение лежит в contextvar, его видят и потоки
+sync_to_async. Запись всегда идёт в default; запрос, который что-то
+записал, ставит клиенту метку, и следующие REPLICA_PIN_SECONDS секунд
+он читает с основной базы и видит свои изменения, пока реплики
+догоняют.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_current = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Реплика для чтения и признак записи в рамках одного запроса."""
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def start_request():
+    state = RoutingState()
+    return state, _current.set(state)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def route_view(request, view_func):
+    """Выбирает реплику для запроса, если представлению можно читать
+    с неё. Одна случайная реплика на весь запрос - чтения согласованы."""
+    state = _current.get()
+    if (
+        state is not None
+        and request.method in ('GET', 'HEAD')
+        and view_func.__module__ in settings.REPLICA_VIEW_MODULES
+        and not getattr(view_func, 'use_primary', False)
+        and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+    ):
+        state.replica = random.choice(settings.DATABASE_REPLICAS)
+
+
+def use_primary(view):
+    """Помечает представление, которое читает только с основной базы."""
+    view.use_primary = True
+    return view
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.replica is None:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает на реплики вместе с данными.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,126 @@
+"""Сессии в кэше с отложенной записью в базу.
+
+Чтение как у cached_db: кэш, при промахе - база. Новая сессия
+создаётся в базе сразу, чтобы ключ был уникальным, а дальнейшие
+сохранения пишутся в кэш и копятся в памяти процесса; в базу их
+сбрасывает flush_sessions() после ответа (сигнал request_finished) не
+чаще раза в SESSION_WRITE_BEHIND_SECONDS и при выходе процесса.
+Несколько сохранений одной сессии за это время дают одну запись.
+
+Сразу в базу пишутся сохранения вне запроса (shell, команды,
+Client.login в тестах) и первое сохранение после create() - смены
+ключа при входе или flush() при выходе: иначе другие воркеры до сброса
+видели бы в базе сессию без данных входа.
+
+Отложенная запись работает только с общим кэшем: до сброса другие
+воркеры видят сессию лишь в нём, поэтому без memcached
+SESSION_WRITE_BEHIND_SECONDS равен None и запись не откладывается.
+Удаление оставляет в кэше отметку, и сессии с ней flush_sessions()
+в любом процессе в базу уже не пишет.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.core.cache import caches
+from django.db import router, transaction
+
+KEY_PREFIX = 'core.sessions'
+DELETED_PREFIX = f'{KEY_PREFIX}.deleted:'
+
+_lock = threading.Lock()
+_pending = {}
+_next_flush = 0
+_request = threading.local()
+
+
+def _cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _deferred():
+    return (
+        settings.SESSION_WRITE_BEHIND_SECONDS is not None
+        and getattr(_request, 'active', False)
+    )
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = KEY_PREFIX
+    _created = False
+
+    def _get_session_from_db(self):
+        with _lock:
+            session = _pending.get(self.session_key)
+        if session is not None and not self._cache.has_key(
+            DELETED_PREFIX + self.session_key
+        ):
+            return session
+        return super()._get_session_from_db()
+
+    def create(self):
+        super().create()
+        self._created = True
+
+    def save(self, must_create=False):
+        created, self._created = self._created, False
+        if (
+            must_create or created or self.session_key is None
+            or not _deferred()
+        ):
+            super().save(must_create)
+            return
+        data = self._get_session()
+        session = self.create_model_instance(data)
+        with _lock:
+            _pending[self.session_key] = session
+        self._cache.set(self.cache_key, data, self.get_expiry_age())
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            # Отметка переживает отложенную копию сессии в любом процессе.
+            self._cache.set(
+                DELETED_PREFIX + session_key, True,
+                settings.SESSION_COOKIE_AGE,
+            )
+        with _lock:
+            _pending.pop(session_key, None)
+        super().delete(session_key)
+
+
+def start_request(**kwargs):
+    """Обработчик request_started."""
+    _request.active = True
+
+
+def flush_sessions(force=False, **kwargs):
+    """Обработчик request_finished: пишет в базу накопленные сессии,
+    если подошёл срок."""
+    global _next_flush
+    _request.active = False
+    with _lock:
+        if not _pending or (not force and time.monotonic() < _next_flush):
+            return 0
+        sessions = list(_pending.values())
+        _pending.clear()
+        _next_flush = time.monotonic() + (
+            settings.SESSION_WRITE_BEHIND_SECONDS or 0
+        )
+    deleted = _cache().get_many(
+        [DELETED_PREFIX + session.session_key for session in sessions]
+    )
+    sessions = [
+        session for session in sessions
+        if DELETED_PREFIX + session.session_key not in deleted
+    ]
+    model = SessionStore.get_model_class()
+    with transaction.atomic(using=router.db_for_write(model)):
+        for session in sessions:
+            session.save()
+    return len(sessions)
+
+
+atexit.register(flush_sessions, force=True)
@@ -0,0 +1,47 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from .metrics import timer
+
+_renders = contextvars.ContextVar('template_renders', default=None)
+
+
+@contextmanager
+def capture_renders():
+    """Собирает (шаблон, контекст, запрос) рендеров верхнего уровня.
+
+    Нужен замерам: шаблон страницы потом рендерится повторно уже без
+    работы представления.
+    """
+    renders = []
+    token = _renders.set(renders)
+    try:
+        yield renders
+    finally:
+        _renders.reset(token)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        renders = _renders.get()
+        if renders is not None:
+            renders.append((self, context, request))
+        with timer('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который учитывает время рендера в метриках.
+
+    Считается только рендер верхнего шаблона: include и extends
+    выполняются внутри него и не учитываются дважды.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,582 @@
+import os
+import subprocess
+import sys
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from http import HTTPStatus
+from posts import views as posts_views
+from posts.models import Follow, Group, Post
+
+from . import cache as core_cache
+from . import counts, database, metrics, page_cache, profiling, sessions
+from .auth import user_cache_key
+from .middleware import ReplicaRoutingMiddleware, SamplingProfilerMiddleware
+from .sessions import SessionStore
+
+User = get_user_model()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.guest_client = Client()
+
+    def series(self, histogram, view):
+        return histogram.series.get(view, ([0], 0.0))
+
+    def test_request_is_recorded_by_view_name(self):
+        counts, _ = self.series(metrics.DURATION, 'about:author')
+        before = counts[-1]
+        self.guest_client.get(reverse('about:author'))
+        counts, _ = self.series(metrics.DURATION, 'about:author')
+        self.assertEqual(counts[-1], before + 1)
+        _, template_time = self.series(metrics.TEMPLATE_TIME, 'about:author')
+        self.assertGreater(template_time, 0)
+
+    def test_queries_are_counted(self):
+        user = User.objects.create_user(username='reader')
+        self.guest_client.force_login(user)
+        _, before = self.series(metrics.QUERIES, 'posts:follow_index')
+        self.guest_client.get(reverse('posts:follow_index'))
+        _, after = self.series(metrics.QUERIES, 'posts:follow_index')
+        self.assertGreater(after, before)
+
+    def test_metrics_endpoint(self):
+        self.guest_client.get(reverse('about:tech'))
+        response = self.guest_client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertContains(
+            response,
+            'yatube_request_duration_seconds_count{view="about:tech"}',
+        )
+        self.assertContains(response, 'yatube_request_queries_bucket')
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_hidden_from_other_addresses(self):
+        response = self.guest_client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_is_logged(self):
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.guest_client.get(reverse('about:author'))
+        self.assertIn('about:author', logs.output[0])
+        self.assertGreaterEqual(
+            metrics.SLOW_REQUESTS.series['about:author'], 1
+        )
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling.reset()
+        self.addCleanup(profiling.reset)
+        self.factory = RequestFactory()
+
+    def profiled_request(self, url):
+        request = self.factory.get(url)
+
+        def get_response(request):
+            profiling.sample()
+            return HttpResponse()
+
+        middleware = SamplingProfilerMiddleware(get_response)
+        middleware(request)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_stacks_are_grouped_by_url_name(self):
+        self.profiled_request(reverse('about:author'))
+        self.assertEqual(profiling.views(), {'about:author': 1})
+        line = profiling.collapsed()
+        self.assertTrue(line.startswith('about:author;'))
+        self.assertIn('core.middleware:__call__;core.tests:get_response', line)
+        # После ответа поток больше не профилируется.
+        profiling.sample()
+        self.assertEqual(profiling.views(), {'about:author': 1})
+
+    @override_settings(PROFILE_SAMPLE_RATE=0)
+    def test_disabled_without_sample_rate(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            SamplingProfilerMiddleware(lambda request: HttpResponse())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_download_is_staff_only(self):
+        self.profiled_request(reverse('about:tech'))
+        url = reverse('core:profile_stacks')
+        user = User.objects.create_user(username='user')
+        client = Client()
+        client.force_login(user)
+        self.assertEqual(client.get(url).status_code, HTTPStatus.FOUND)
+        user.is_staff = True
+        user.save()
+        response = client.get(url, {'view': 'about:tech', 'reset': 1})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('about-tech.folded', response['Content-Disposition'])
+        self.assertContains(response, 'about:tech;')
+        # GET ничего не меняет, очищает накопленное только POST.
+        self.assertNotEqual(profiling.views(), {})
+        response = client.post(f'{url}?view=about:tech')
+        self.assertContains(response, 'about:tech;')
+        self.assertEqual(profiling.views(), {})
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_anonymous_fast_path_is_profiled(self):
+        """Кэш страниц и быстрый путь не обходят профилировщик."""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        group = Group.objects.create(title='Группа', slug='group')
+        url = reverse('posts:group', args=[group.slug])
+        with mock.patch.object(profiling, 'start') as start:
+            client = Client()
+            client.get(url)
+            response = client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(
+            [call.args[0] for call in start.call_args_list],
+            ['posts:group', 'posts:group'],
+        )
+
+
+def reading_view(request):
+    return HttpResponse(router.db_for_read(Post))
+
+
+def writing_view(request):
+    return HttpResponse(router.db_for_write(Post))
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica1'], REPLICA_VIEW_MODULES=('core.tests',)
+)
+class ReplicaRoutingTests(TestCase):
+    def request(self, view, method='get', cookies=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request)
+
+    def test_get_reads_from_replica(self):
+        response = self.request(reading_view)
+        self.assertEqual(response.content, b'replica1')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        # Вне запроса чтения идут в основную базу.
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_post_reads_from_primary(self):
+        response = self.request(reading_view, method='post')
+        self.assertEqual(response.content, b'default')
+
+    @override_settings(REPLICA_VIEW_MODULES=('about.views',))
+    def test_other_modules_read_from_primary(self):
+        response = self.request(reading_view)
+        self.assertEqual(response.content, b'default')
+
+    def test_write_pins_client_to_primary(self):
+        response = self.request(writing_view, method='post')
+        self.assertEqual(response.content, b'default')
+        pin = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(pin['max-age'], settings.REPLICA_PIN_SECONDS)
+        response = self.request(reading_view, cookies={
+            settings.REPLICA_PIN_COOKIE: '1',
+        })
+        self.assertEqual(response.content, b'default')
+
+    def test_write_views_use_primary(self):
+        for view in (
+            posts_views.post_create, posts_views.post_edit,
+            posts_views.add_comment, posts_views.profile_follow,
+        ):
+            with self.subTest(view=view.__name__):
+                self.assertTrue(view.use_primary)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_disabled_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+
+class DatabaseSetupTests(TestCase):
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_sqlite_pragmas(self):
+        database.on_connection_created(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+            cursor.execute('PRAGMA busy_timeout = 5000')
+
+    @override_settings(CONN_HEALTH_CHECKS=True)
+    def test_broken_connection_is_closed(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            database.check_connections()
+        close.assert_called_once()
+
+    def run_production(self, code, **environ):
+        env = dict(os.environ)
+        env.pop('YATUBE_CACHE', None)
+        env.update(
+            DJANGO_SETTINGS_MODULE='yatube.settings',
+            YATUBE_SETTINGS_PROFILE='production',
+            YATUBE_SECRET_KEY='test',
+            **environ,
+        )
+        return subprocess.run(
+            [sys.executable, '-c', code], env=env, cwd=settings.BASE_DIR,
+            capture_output=True, text=True,
+        )
+
+    def test_production_profile(self):
+        code = (
+            'from django.conf import settings; '
+            'print(settings.DEBUG, settings.CONN_MAX_AGE, '
+            'settings.SQLITE_PRAGMAS["journal_mode"], '
+            '"debug_toolbar" in settings.INSTALLED_APPS, '
+            'settings.SHARED_CACHE)'
+        )
+        output = self.run_production(code).stdout
+        self.assertEqual(
+            output.split(), ['False', '600', 'WAL', 'False', 'memcached']
+        )
+
+    def test_production_requires_shared_cache(self):
+        for backend in ('locmem', 'file'):
+            with self.subTest(backend=backend):
+                result = self.run_production(
+                    'import django.conf; django.conf.settings.DEBUG',
+                    YATUBE_CACHE=backend,
+                )
+                self.assertNotEqual(result.returncode, 0)
+                self.assertIn('ImproperlyConfigured', result.stderr)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.local = caches['local']
+        self.shared = caches['shared']
+
+    def test_shared_value_is_copied_to_local(self):
+        self.shared.set('key', 'value')
+        self.assertIsNone(self.local.get('key'))
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(self.local.get('key'), 'value')
+
+    def test_writes_go_to_both_levels(self):
+        cache.set('key', 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.local.get('key'), 'value')
+        cache.delete('key')
+        self.assertFalse(cache.has_key('key'))
+        self.assertIsNone(self.local.get('key'))
+
+    def test_incr_invalidates_local(self):
+        cache.set('counter', 1)
+        self.assertEqual(cache.incr('counter'), 2)
+        self.assertEqual(cache.get('counter'), 2)
+
+    def test_bump_version(self):
+        version = core_cache.get_version('test')
+        core_cache.bump_version('test')
+        self.assertEqual(core_cache.get_version('test'), version + 1)
+
+
+class CachedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_value_is_computed_once_per_version(self):
+        self.assertEqual(core_cache.cached('key', self.compute, 60, 1), 1)
+        self.assertEqual(core_cache.cached('key', self.compute, 60, 1), 1)
+        self.assertEqual(core_cache.cached('key', self.compute, 60, 2), 2)
+
+    def test_stale_value_is_served_while_locked(self):
+        core_cache.cached('key', self.compute, 60, 1)
+        cache.add('key:lock', 1)
+        self.assertEqual(core_cache.cached('key', self.compute, 60, 2), 1)
+        cache.delete('key:lock')
+        self.assertEqual(core_cache.cached('key', self.compute, 60, 2), 2)
+
+    @override_settings(CACHE_LOCK_SECONDS=0.1)
+    def test_missing_value_is_computed_after_waiting(self):
+        cache.add('key:lock', 1)
+        self.assertEqual(core_cache.cached('key', self.compute, 60, 1), 1)
+
+
+class CountsTests(TestCase):
+    def test_postgres_estimate_reads_plan_from_cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        # psycopg2 отдаёт план уже разобранным.
+        cursor.fetchone.return_value = ([{'Plan': {'Plan Rows': 1234}}],)
+        queryset = Post.objects.filter(text='пост')
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor):
+            self.assertEqual(counts.estimate(queryset), 1234)
+        [(sql, params)] = [
+            call.args for call in cursor.execute.call_args_list
+            if call.args[0].startswith('EXPLAIN')
+        ]
+        self.assertTrue(sql.startswith('EXPLAIN (FORMAT JSON) SELECT'))
+        self.assertEqual(list(params), ['пост'])
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='user')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_auth_skips_database_when_cached(self):
+        self.client.get(reverse('about:author'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('about:author'))
+        self.assertContains(response, 'user')
+
+    def test_user_is_invalidated_on_save(self):
+        self.client.get(reverse('about:author'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.id)))
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+        # Старая сессия после смены пароля больше не действует.
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+
+@override_settings(SESSION_WRITE_BEHIND_SECONDS=0)
+class WriteBehindSessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def stored(self, session_key):
+        return Session.objects.get(session_key=session_key).get_decoded()
+
+    def in_request(self):
+        sessions.start_request()
+        self.addCleanup(sessions.flush_sessions, force=True)
+
+    def test_saves_in_request_are_written_after_response(self):
+        store = SessionStore()
+        store.create()
+        self.in_request()
+        store['key'] = 'value'
+        store.save()
+        store['key'] = 'new'
+        store.save()
+        self.assertEqual(self.stored(store.session_key)['key'], 'value')
+        self.assertEqual(SessionStore(store.session_key)['key'], 'new')
+        cache.clear()
+        self.assertEqual(SessionStore(store.session_key)['key'], 'new')
+        self.assertEqual(sessions.flush_sessions(), 1)
+        self.assertEqual(self.stored(store.session_key)['key'], 'new')
+
+    def test_saves_outside_request_are_written_at_once(self):
+        store = SessionStore()
+        store['key'] = 'value'
+        store.save()
+        self.assertEqual(self.stored(store.session_key)['key'], 'value')
+
+    def test_first_save_after_cycle_key_is_written_at_once(self):
+        store = SessionStore()
+        store.create()
+        self.in_request()
+        store.cycle_key()
+        store['_auth_user_id'] = '1'
+        store.save()
+        self.assertEqual(self.stored(store.session_key)['_auth_user_id'], '1')
+
+    @override_settings(SESSION_WRITE_BEHIND_SECONDS=None)
+    def test_without_shared_cache_saves_are_written_at_once(self):
+        store = SessionStore()
+        store.create()
+        self.in_request()
+        store.save()
+        store['key'] = 'value'
+        store.save()
+        self.assertEqual(self.stored(store.session_key)['key'], 'value')
+
+    def test_deleted_session_is_not_flushed_by_other_process(self):
+        store = SessionStore()
+        store.create()
+        self.in_request()
+        store.save()
+        store['key'] = 'value'
+        store.save()
+        pending = dict(sessions._pending)
+        store.delete()
+        # Копия сессии, отложенная другим воркером.
+        sessions._pending.update(pending)
+        self.assertIsNone(SessionStore(store.session_key).get('key'))
+        self.assertEqual(sessions.flush_sessions(), 0)
+        self.assertFalse(
+            Session.objects.filter(session_key=store.session_key).exists()
+        )
+
+
+class AnonymousFastPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.guest_client = Client()
+
+    def test_anonymous_read_is_public(self):
+        for url in (reverse('posts:main'), reverse('about:tech')):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn(
+                    f'max-age={settings.ANONYMOUS_CACHE_SECONDS}',
+                    response['Cache-Control'],
+                )
+                self.assertIn('Cookie', response['Vary'])
+                self.assertEqual(response['X-Frame-Options'], 'DENY')
+                self.assertFalse(response.cookies)
+
+    def test_other_requests_take_full_path(self):
+        user = User.objects.create_user(username='user')
+        client = Client()
+        client.force_login(user)
+        responses = (
+            client.get(reverse('posts:main')),
+            self.guest_client.get(reverse('users:login')),
+            self.guest_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': 0})
+            ),
+        )
+        for response in responses:
+            with self.subTest(url=response.request['PATH_INFO']):
+                self.assertNotIn('public', response.get('Cache-Control', ''))
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.guest_client = Client()
+        self.urls = {
+            'post': reverse('posts:post_detail', args=[self.post.id]),
+            'group': reverse('posts:group', args=[self.group.slug]),
+            'author': reverse('posts:profile', args=[self.author.username]),
+        }
+
+    def cached(self, name):
+        return self.guest_client.get(self.urls[name]).get('X-Page-Cache')
+
+    def warm(self):
+        for name in self.urls:
+            self.guest_client.get(self.urls[name])
+
+    def test_pages_are_cached_with_surrogate_keys(self):
+        response = self.guest_client.get(self.urls['post'])
+        self.assertEqual(
+            response['Surrogate-Key'].split(),
+            [f'post:{self.post.id}', 'author:author', 'group:group'],
+        )
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(self.urls['post'])
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Пост')
+
+    def test_post_edit_purges_its_pages(self):
+        self.warm()
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        for name in self.urls:
+            with self.subTest(page=name):
+                self.assertIsNone(self.cached(name))
+        self.assertContains(
+            self.guest_client.get(self.urls['post']), 'Исправленный пост'
+        )
+
+    def test_follow_purges_only_author_pages(self):
+        self.warm()
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertIsNone(self.cached('author'))
+        self.assertIsNone(self.cached('post'))
+        self.assertEqual(self.cached('group'), 'hit')
+
+    def test_only_own_key_purge_blocks_store(self):
+        """Сброс чужого ключа во время рендера не мешает сохранить
+        страницу, сброс своего - мешает."""
+        request = RequestFactory().get(self.urls['group'])
+
+        def rendered():
+            response = HttpResponse('Страница')
+            response['Cache-Control'] = 'public, max-age=60'
+            return page_cache.add_surrogate_keys(response, 'group:group')
+
+        started = time.time()
+        page_cache.purge_now('group:other')
+        page_cache.store_page(request, rendered(), started)
+        self.assertIsNotNone(page_cache.get_page(request))
+        cache.clear()
+        started = time.time()
+        page_cache.purge_now('group:group')
+        page_cache.store_page(request, rendered(), started)
+        self.assertIsNone(page_cache.get_page(request))
+
+    def test_logged_in_users_bypass_cache(self):
+        self.warm()
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(self.urls['post'])
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_purge_endpoint(self):
+        self.warm()
+        response = self.guest_client.post(
+            reverse('core:purge'), HTTP_SURROGATE_KEY='group:group'
+        )
+        self.assertEqual(response.json(), {'purged': ['group:group']})
+        self.assertIsNone(self.cached('group'))
+        self.assertEqual(self.cached('author'), 'hit')
+
+    @override_settings(PAGE_CACHE_PURGE_URLS=['http://proxy.local/purge/'])
+    def test_purge_is_forwarded(self):
+        with mock.patch('urllib.request.urlopen') as urlopen:
+            page_cache._forward(['group:тест'])
+        request = urlopen.call_args[0][0]
+        self.assertEqual(request.full_url, 'http://proxy.local/purge/')
+        self.assertEqual(request.get_method(), 'POST')
+        self.assertEqual(
+            request.get_header('Surrogate-key'),
+            'group:%D1%82%D0%B5%D1%81%D1%82',
+        )
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('metrics', views.metrics, name='metrics'),
+    path('profiling/', views.profile_stacks, name='profile_stacks'),
+    path('purge/', views.purge, name='purge'),
+]
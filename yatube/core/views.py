@@ -1,6 +1,14 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
 from http import HTTPStatus
 
+from . import page_cache, profiling
+from .metrics import render_metrics
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -31,3 +39,44 @@ def page_forbidden(request):
         {'path': request.path},
         status=403
     )
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        render_metrics(), content_type='text/plain; version=0.0.4'
+    )
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def profile_stacks(request):
+    """Свёрнутые стеки профилировщика для флейм-графа.
+
+    ?view=posts:main - только одно имя URL. POST выгружает так же и
+    очищает всё накопленное.
+    """
+    view = request.GET.get('view') or None
+    response = HttpResponse(
+        profiling.collapsed(view), content_type='text/plain; charset=utf-8'
+    )
+    name = (view or 'all').replace(':', '-')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}.folded"'
+    )
+    if request.method == 'POST':
+        profiling.reset()
+    return response
+
+
+@csrf_exempt
+@require_POST
+def purge(request):
+    """Сбрасывает страницы по ключам из заголовка Surrogate-Key."""
+    if request.META.get('REMOTE_ADDR') not in settings.PURGE_ALLOWED_IPS:
+        raise Http404
+    keys = request.headers.get(page_cache.HEADER, '')
+    page_cache.purge_header(keys)
+    return JsonResponse({'purged': keys.split()})
@@ -0,0 +1,360 @@
+"""JSON API поверх тех же запросов, что и HTML-страницы.
+
+Списки листаются курсором. GET-ответы несут ETag и Last-Modified,
+посчитанные по версии ленты (её увеличивают сигналы при любом
+изменении постов, групп и комментариев), поэтому повторный запрос
+без изменений получает 304 после одного обращения к кэшу, не трогая
+базу. Условия проверяются по ETag; If-Modified-Since учитывается,
+только если клиент не прислал If-None-Match.
+
+Клиенты без браузера (приложения, партнёры) получают токен в
+POST /api/v1/token/ по логину и паролю и шлют его в заголовке
+"Authorization: Token <токен>". Такие запросы не проверяются на CSRF:
+токен не отправляется браузером сам. Запросы с сессией проверяются
+как обычные формы сайта. Токен подписан SECRET_KEY, живёт
+API_TOKEN_MAX_AGE секунд и перестаёт действовать при смене пароля.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from core.auth import CachedModelBackend
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core import signing
+from django.db.models import Count, Max
+from django.http import JsonResponse, QueryDict
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+from yatube.paginator import (
+    COMMENT_ORDERING, CURSOR_PARAM, FEED_ORDERING, get_cursor_page,
+)
+
+from .cache import get_feed_modified, get_feed_version
+from .feed import follow_page
+from .forms import CommentForm, PostForm
+from .thumbnails import schedule_thumbnails
+from .models import Follow, Group, Post, User
+
+
+def serialize_post(post):
+    return {
+        'id': post.id,
+        'text': post.text,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'pub_date': post.pub_date.isoformat(),
+        'image': post.image.url if post.image else None,
+        'comment_count': post.comment_count,
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.id,
+        'post': comment.post_id,
+        'author': comment.author.username,
+        'text': comment.text,
+        'pub_date': comment.pub_date.isoformat(),
+    }
+
+
+def _page(request, query_set, serializer, ordering=FEED_ORDERING,
+          per_page=settings.POSTS_PER_PAGE):
+    page = get_cursor_page(request, query_set, ordering, per_page)
+    return _page_response(page, serializer)
+
+
+def _page_response(page, serializer):
+    return JsonResponse({
+        'results': [serializer(obj) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+TOKEN_SALT = 'posts.api.token'
+FORM_TYPE = 'application/x-www-form-urlencoded'
+
+
+def _data(request):
+    """Тело запроса: JSON или обычная форма.
+
+    request.POST Django разбирает только для POST, форму в теле PATCH
+    разбираем сами. Файлы принимаются только в POST.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None, None
+        return (data if isinstance(data, dict) else None), None
+    if request.method == 'POST':
+        return request.POST.dict(), request.FILES
+    return QueryDict(request.body, encoding=request.encoding).dict(), None
+
+
+def _unsupported(request):
+    """Тело не-POST запроса: только JSON или форма без файлов."""
+    return request.method != 'POST' and request.content_type not in (
+        'application/json', FORM_TYPE,
+    )
+
+
+def _post_form_data(data, post=None):
+    """Данные для PostForm: группа в API задаётся slug'ом."""
+    form_data = {
+        'text': data.get('text', post.text if post else ''),
+        'group': post.group_id if post else None,
+    }
+    if data.get('group'):
+        # Неизвестный slug оставляем как есть - форма его отклонит.
+        form_data['group'] = Group.objects.filter(
+            slug=data['group']
+        ).values_list('id', flat=True).first() or data['group']
+    elif 'group' in data:
+        form_data['group'] = None
+    return form_data
+
+
+def _error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def _invalid(form):
+    return JsonResponse({'errors': form.errors}, status=400)
+
+
+def _password_mark(user):
+    # Смена пароля меняет отметку и отзывает выданные токены.
+    return salted_hmac(TOKEN_SALT, user.password).hexdigest()[:20]
+
+
+def make_token(user):
+    return signing.dumps(
+        {'user': user.pk, 'mark': _password_mark(user)}, salt=TOKEN_SALT
+    )
+
+
+def token_user(token):
+    """Пользователь токена или None, если токен неверен или устарел."""
+    try:
+        data = signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.API_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    user = CachedModelBackend().get_user(data['user'])
+    if user is None or not constant_time_compare(
+        data['mark'], _password_mark(user)
+    ):
+        return None
+    return user
+
+
+def _csrf_rejected(request):
+    # Представления API помечены csrf_exempt, чтобы пропустить запросы
+    # с токеном; запросы с сессией проверяем здесь той же проверкой.
+    check = CsrfViewMiddleware(lambda request: None)
+    return check.process_view(request, None, (), {}) is not None
+
+
+def api_login_required(view=None, writes_only=False):
+    """Как login_required, но вместо редиректа - 401 в JSON.
+
+    Пользователь берётся из токена в заголовке Authorization или из
+    сессии; изменения по сессии проходят проверку CSRF. С
+    writes_only=True чтение доступно анонимам.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            scheme, _, token = request.META.get(
+                'HTTP_AUTHORIZATION', ''
+            ).partition(' ')
+            safe = request.method in ('GET', 'HEAD')
+            if scheme == 'Token':
+                request.user = token_user(token)
+                if request.user is None:
+                    return _error('Неверный токен.', 401)
+            elif not safe and _csrf_rejected(request):
+                return _error('Нет CSRF-токена.', 403)
+            if not (writes_only and safe):
+                if not request.user.is_authenticated:
+                    return _error('Нужна авторизация.', 401)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator(view) if view else decorator
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def token(request):
+    """Выдаёт токен по username и password."""
+    data, _ = _data(request)
+    if data is None:
+        return _error('Неверный JSON.', 400)
+    user = authenticate(
+        request,
+        username=data.get('username'),
+        password=data.get('password'),
+    )
+    if user is None:
+        return _error('Неверный логин или пароль.', 400)
+    return JsonResponse({'token': make_token(user)})
+
+
+def _etag(request, *args, **kwargs):
+    return f'{get_feed_version()}-' + hashlib.md5(
+        request.get_full_path().encode()
+    ).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    # Время последнего изменения чего-либо в лентах: правки постов и
+    # комментарии сдвигают его так же, как новые посты.
+    return get_feed_modified()
+
+
+# Картинки отдаются ссылкой на оригинал, варианты не подгружаем.
+def _feed_posts(request):
+    return Post.objects.select_related('author', 'group')
+
+
+def _group_posts(request, slug):
+    return _feed_posts(request).filter(group__slug=slug)
+
+
+def _user_posts(request, username):
+    return _feed_posts(request).filter(author__username=username)
+
+
+def _follow_etag(request):
+    # Подписки не меняют версию ленты, поэтому учитываем их отдельно.
+    follows = Follow.objects.filter(user=request.user).aggregate(
+        last=Max('id'), total=Count('id')
+    )
+    return (
+        f'{_etag(request)}-{request.user.id}-'
+        f'{follows["last"]}-{follows["total"]}'
+    )
+
+
+@require_http_methods(['GET', 'HEAD', 'POST'])
+@api_login_required(writes_only=True)
+@condition(_etag, _last_modified)
+def posts(request):
+    """Главная лента; POST создаёт пост."""
+    if request.method == 'POST':
+        data, files = _data(request)
+        if data is None:
+            return _error('Неверный JSON.', 400)
+        form = PostForm(_post_form_data(data), files=files)
+        if not form.is_valid():
+            return _invalid(form)
+        post = form.save(commit=False)
+        post.author = request.user
+        post.save()
+        schedule_thumbnails(post)
+        return JsonResponse(serialize_post(post), status=201)
+    return _page(request, _feed_posts(request), serialize_post)
+
+
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+@api_login_required(writes_only=True)
+@condition(_etag, _last_modified)
+def post_detail(request, post_id):
+    """Пост; PATCH от автора меняет текст и группу."""
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    if request.method == 'PATCH':
+        if post.author != request.user:
+            return _error('Править пост может только автор.', 403)
+        if _unsupported(request):
+            return _error('Тело - JSON или форма без файлов.', 415)
+        data, _ = _data(request)
+        if data is None:
+            return _error('Неверный JSON.', 400)
+        form = PostForm(_post_form_data(data, post), instance=post)
+        if not form.is_valid():
+            return _invalid(form)
+        post = form.save(commit=False)
+        post.save(update_fields=['text', 'group'])
+    return JsonResponse(serialize_post(post))
+
+
+@require_http_methods(['GET', 'HEAD', 'POST'])
+@api_login_required(writes_only=True)
+@condition(_etag, _last_modified)
+def post_comments(request, post_id):
+    """Комментарии поста от старых к новым; POST добавляет комментарий."""
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    if request.method == 'POST':
+        data, _ = _data(request)
+        if data is None:
+            return _error('Неверный JSON.', 400)
+        form = CommentForm(data)
+        if not form.is_valid():
+            return _invalid(form)
+        comment = form.save(commit=False)
+        comment.author = request.user
+        comment.post = post
+        comment.save()
+        return JsonResponse(serialize_comment(comment), status=201)
+    return _page(
+        request,
+        post.comments.select_related('author'),
+        serialize_comment,
+        COMMENT_ORDERING,
+        settings.COMMENTS_PER_PAGE,
+    )
+
+
+@require_http_methods(['GET', 'HEAD'])
+@condition(_etag, _last_modified)
+def group_posts(request, slug):
+    get_object_or_404(Group.objects.only('id'), slug=slug)
+    return _page(request, _group_posts(request, slug), serialize_post)
+
+
+@require_http_methods(['GET', 'HEAD'])
+@condition(_etag, _last_modified)
+def user_posts(request, username):
+    get_object_or_404(User.objects.only('id'), username=username)
+    return _page(request, _user_posts(request, username), serialize_post)
+
+
+@require_http_methods(['GET', 'HEAD'])
+@api_login_required
+@condition(_follow_etag)
+def follow_posts(request):
+    """Лента подписок текущего пользователя."""
+    return _page_response(
+        follow_page(request.user, request.GET.get(CURSOR_PARAM)),
+        serialize_post,
+    )
+
+
+@require_http_methods(['POST', 'DELETE'])
+@api_login_required
+def follow(request, username):
+    """POST подписывает на автора, DELETE отписывает."""
+    author = get_object_or_404(User, username=username)
+    if author == request.user:
+        return _error('Нельзя подписаться на себя.', 400)
+    if request.method == 'DELETE':
+        Follow.objects.filter(user=request.user, author=author).delete()
+        return JsonResponse({'author': username, 'following': False})
+    _, created = Follow.objects.get_or_create(
+        user=request.user, author=author
+    )
+    return JsonResponse(
+        {'author': username, 'following': True},
+        status=201 if created else 200,
+    )
+
@@ -0,0 +1,23 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('token/', api.token, name='token'),
+    path('posts/', api.posts, name='posts'),
+    path('posts/<int:post_id>/', api.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        api.post_comments,
+        name='post_comments'
+    ),
+    path('groups/<slug:slug>/posts/', api.group_posts, name='group_posts'),
+    path(
+        'users/<str:username>/posts/',
+        api.user_posts,
+        name='user_posts'
+    ),
+    path('users/<str:username>/follow/', api.follow, name='follow'),
+    path('follow/', api.follow_posts, name='follow_posts'),
+]
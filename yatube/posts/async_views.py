@@ -0,0 +1,183 @@
+"""Async-версии представлений лент и страницы поста.
+
+ORM в Django 3.2 синхронная, поэтому каждый запрос к базе уходит в пул
+потоков через sync_to_async(thread_sensitive=False), а цикл событий тем
+временем обслуживает другие запросы. Независимые запросы, например
+автор и проверка подписки на странице профиля, идут одновременно через
+asyncio.gather. Шаблон тоже рендерится в потоке: он читает хранилище
+миниатюр. Включаются настройкой ASYNC_VIEWS.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from core.cache import cached
+from core.page_cache import add_surrogate_keys
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from yatube.paginator import (
+    COMMENT_ORDERING, CURSOR_PARAM, get_cursor_page, get_paginator_page,
+)
+
+from .cache import (
+    author_key, feed_page_key, get_feed_version, group_key, post_keys,
+)
+from .feed import follow_page
+from .forms import CommentForm
+from .models import Comment, Follow, Group, Post, User
+from .views import profile_page
+
+
+def _call(func, *args, **kwargs):
+    # Как database_sync_to_async в channels: у потоков пула свои
+    # соединения, закрываем их по правилам CONN_MAX_AGE.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run(func, *args, **kwargs):
+    """Выполняет синхронный код в пуле потоков."""
+    return sync_to_async(_call, thread_sensitive=False)(
+        func, *args, **kwargs
+    )
+
+
+def _is_authenticated(request):
+    # Ленивый request.user загружается из сессии здесь, в потоке,
+    # параллельно с запросами страницы, а не потом в шаблоне.
+    return request.user.is_authenticated
+
+
+def _first(query_set):
+    return query_set.first()
+
+
+def _page(request, posts):
+    page_obj = get_paginator_page(request, posts)
+    # Страница вычисляется в потоке, а не лениво при рендере.
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
+
+
+def _following(user, username):
+    return Follow.objects.filter(
+        user=user, author__username=username
+    ).exists()
+
+
+def _comments_page(request, post_id):
+    return get_cursor_page(
+        request,
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        ordering=COMMENT_ORDERING,
+        per_page=settings.COMMENTS_PER_PAGE,
+    )
+
+
+def _index_page(request, feed_version):
+    context = {
+        'page_obj': _page(request, Post.objects.for_feed()),
+        'feed_version': feed_version,
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
+    return render(request, 'posts/index.html', context)
+
+
+async def index(request):
+    """Главная страница. Анонимам отдаётся целиком из кэша."""
+    authenticated, feed_version = await asyncio.gather(
+        run(_is_authenticated, request), run(get_feed_version)
+    )
+    if authenticated:
+        return await run(_index_page, request, feed_version)
+    content = await run(
+        cached,
+        feed_page_key(request),
+        lambda: _index_page(request, feed_version).content,
+        settings.FEED_CACHE_TIMEOUT,
+        version=feed_version,
+    )
+    return HttpResponse(content)
+
+
+async def group_posts(request, slug):
+    posts = Post.objects.for_feed().filter(group__slug=slug)
+    group, page_obj, _ = await asyncio.gather(
+        run(_first, Group.objects.filter(slug=slug)),
+        run(_page, request, posts),
+        run(_is_authenticated, request),
+    )
+    if group is None:
+        raise Http404('Группа не найдена')
+    context = {
+        'group': group,
+        'page_obj': page_obj,
+        'posts': posts,
+    }
+    response = await run(render, request, 'posts/group_list.html', context)
+    return add_surrogate_keys(response, group_key(slug))
+
+
+async def profile(request, username):
+    authenticated = await run(_is_authenticated, request)
+    author, following = await asyncio.gather(
+        run(_first, User.objects.select_related('stats').filter(
+            username=username
+        )),
+        run(_following, request.user, username) if authenticated
+        else asyncio.sleep(0, False),
+    )
+    if author is None:
+        raise Http404('Пользователь не найден')
+    # Страница строится после автора: число постов берётся из его
+    # AuthorStats, как в синхронном представлении.
+    context = {
+        'page_obj': await run(profile_page, request, author),
+        'author': author,
+        'posts': author.posts.for_feed(),
+        'following': following,
+    }
+    response = await run(render, request, 'posts/profile.html', context)
+    return add_surrogate_keys(response, author_key(username))
+
+
+async def post_detail(request, post_id):
+    post, comments, _ = await asyncio.gather(
+        run(_first, Post.objects.select_related(
+            'author__stats', 'group'
+        ).prefetch_related('image_variants').filter(id=post_id)),
+        run(_comments_page, request, post_id),
+        run(_is_authenticated, request),
+    )
+    if post is None:
+        raise Http404('Пост не найден')
+    context = {
+        'post': post,
+        'form': CommentForm(),
+        'comments': comments,
+        'newer_cursor': (
+            comments.paginator.cursor_for(comments[-1]) if comments else ''
+        ),
+    }
+    response = await run(render, request, 'posts/post_detail.html', context)
+    return add_surrogate_keys(response, *post_keys(
+        post.id, post.author.username,
+        post.group.slug if post.group_id else None,
+    ))
+
+
+async def follow_index(request):
+    """Страница с авторами на которых подписаны."""
+    if not await run(_is_authenticated, request):
+        return redirect_to_login(request.get_full_path())
+    context = {
+        'page_obj': await run(
+            follow_page, request.user, request.GET.get(CURSOR_PARAM)
+        ),
+    }
+    return await run(render, request, 'posts/follow.html', context)
@@ -0,0 +1,437 @@
+"""Генерация тестовых данных и замеры страниц для нагрузочных прогонов.
+
+Seeder быстро наполняет базу: строки пишутся через bulk_create пачками,
+id раздаются заранее, популярность авторов распределена по Ципфу, так
+что у немногих авторов много подписчиков и постов. Производные таблицы
+(ленты, поисковый индекс, счётчики) строятся теми же функциями, что и
+при импорте.
+
+run_benchmark() открывает каждую страницу posts.urls, users.urls и
+about.urls тестовым клиентом или по HTTP и считает перцентили
+задержки, число SQL-запросов и пропускную способность.
+
+run_template_benchmark() замеряет отдельно рендер шаблонов лент: страница
+открывается один раз, а её шаблон с готовым контекстом рендерится
+повторно, так что в замер не входят представление и ORM.
+"""
+import io
+import itertools
+import math
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+
+from about import urls as about_urls
+from core import counts
+from core.template_backends import capture_renders
+from users import urls as users_urls
+
+from . import counters, feed, search
+from . import urls as posts_urls
+from .models import Comment, Follow, Group, Post, User
+from .transfer import bulk_create_dated, reset_sequences
+
+WORDS = (
+    'кошка собака город река лес море солнце дождь снег зима лето осень '
+    'весна дорога поезд книга музыка фильм друг семья работа школа '
+    'утро вечер ночь день небо звезда гора поле цветок сад дом окно '
+    'чай кофе хлеб праздник путешествие фотография история новость '
+    'python django yatube'.split()
+)
+IMAGE_COUNT = 5
+# GET по этим адресам меняет данные или завершает сессию.
+SKIP_URLS = {
+    'posts:profile_follow', 'posts:profile_unfollow', 'users:logout',
+}
+# Страницы со списками постов для замера рендера шаблонов.
+FEED_PAGES = (
+    'posts:main', 'posts:group', 'posts:profile', 'posts:follow_index',
+    'posts:search', 'posts:post_detail',
+)
+SEARCH_QUERY = 'python'
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _bench_images(width=1280, height=720):
+    """Несколько настоящих JPEG для постов с картинками."""
+    names = []
+    for i in range(IMAGE_COUNT):
+        name = f'posts/bench/bench_{i}.jpg'
+        if not default_storage.exists(name):
+            image = Image.new(
+                'RGB', (width, height), (40 * i, 120, 255 - 40 * i)
+            )
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=80)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        names.append(name)
+    return names
+
+
+class Seeder:
+    """Наполняет базу синтетическими данными заданного размера."""
+
+    def __init__(self, users, posts, groups=20, follows_per_user=20,
+                 comments_per_post=2, skew=1.1, image_share=0.1,
+                 days=365, batch_size=5000, random_seed=0,
+                 prefix='bench'):
+        self.users = users
+        self.posts = posts
+        self.groups = groups
+        self.follows_per_user = follows_per_user
+        self.comments_per_post = comments_per_post
+        self.skew = skew
+        self.image_share = image_share
+        self.days = days
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.random = random.Random(random_seed)
+
+    def _popular(self, ids, k):
+        """k случайных id, первые в списке выпадают чаще (закон Ципфа)."""
+        return self.random.choices(ids, cum_weights=self.cum_weights, k=k)
+
+    def seed_users(self):
+        # Один непригодный для входа хеш на всех: make_password медленный.
+        password = make_password(None)
+        first_id = _next_id(User)
+        ids = list(range(first_id, first_id + self.users))
+        for batch in _batches(ids, self.batch_size):
+            User.objects.bulk_create([
+                User(
+                    id=user_id,
+                    username=f'{self.prefix}_{user_id}',
+                    first_name=f'Автор {user_id}',
+                    password=password,
+                )
+                for user_id in batch
+            ])
+        self.user_ids = ids
+        self.cum_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** self.skew for rank in range(len(ids))
+        ))
+
+    def seed_groups(self):
+        first_id = _next_id(Group)
+        Group.objects.bulk_create([
+            Group(
+                id=group_id,
+                title=f'Группа {group_id}',
+                slug=f'{self.prefix}-{group_id}',
+                description='Группа для нагрузочных тестов',
+            )
+            for group_id in range(first_id, first_id + self.groups)
+        ])
+        self.group_ids = list(range(first_id, first_id + self.groups))
+
+    def _follows(self):
+        for user_id in self.user_ids:
+            count = self.random.randint(0, 2 * self.follows_per_user)
+            for author_id in set(self._popular(self.user_ids, count)):
+                if author_id != user_id:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+    def seed_follows(self):
+        for batch in _batches(self._follows(), self.batch_size):
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+        # Число подписчиков решает, раскладывать ли посты автора.
+        counters.rebuild_author_counters(self.batch_size)
+
+    def _text(self):
+        return ' '.join(
+            self.random.choices(WORDS, k=self.random.randint(5, 40))
+        ).capitalize()
+
+    def _posts(self, images):
+        now = timezone.now()
+        post_id = _next_id(Post)
+        for start in range(0, self.posts, self.batch_size):
+            count = min(self.batch_size, self.posts - start)
+            for author_id in self._popular(self.user_ids, count):
+                group_id = None
+                if self.group_ids and self.random.random() < 0.7:
+                    group_id = self.random.choice(self.group_ids)
+                image = ''
+                if images and self.random.random() < self.image_share:
+                    image = self.random.choice(images)
+                yield Post(
+                    id=post_id,
+                    author_id=author_id,
+                    group_id=group_id,
+                    text=self._text(),
+                    pub_date=now - timedelta(
+                        seconds=self.random.uniform(0, self.days * 86400)
+                    ),
+                    image=image,
+                )
+                post_id += 1
+
+    def _comments(self, posts):
+        for post in posts:
+            count = self.random.randint(0, 2 * self.comments_per_post)
+            for _ in range(count):
+                self.comment_id += 1
+                yield Comment(
+                    id=self.comment_id,
+                    post=post,
+                    author_id=self.random.choice(self.user_ids),
+                    text=self._text(),
+                    pub_date=post.pub_date + timedelta(
+                        minutes=self.random.randint(1, 600)
+                    ),
+                )
+
+    def seed_posts(self):
+        images = _bench_images() if self.image_share else []
+        self.comment_id = _next_id(Comment) - 1
+        for batch in _batches(self._posts(images), self.batch_size):
+            with transaction.atomic():
+                bulk_create_dated(Post, batch)
+                bulk_create_dated(Comment, list(self._comments(batch)))
+                feed.push_posts(batch)
+                search.index_posts(batch)
+
+    def run(self):
+        with transaction.atomic():
+            self.seed_users()
+            self.seed_groups()
+            self.seed_follows()
+        self.seed_posts()
+        reset_sequences(User, Group, Post, Comment)
+        counters.rebuild_post_counters(self.batch_size)
+        counters.rebuild_author_counters(self.batch_size)
+        # bulk_create не шлёт сигналов; статистика нужна для оценок
+        # количества строк (core/counts.py).
+        counts.invalidate(Post)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def percentile(samples, share):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+class HttpClient:
+    """Клиент для уже запущенного сервера. SQL-запросы не считаются."""
+
+    counts_queries = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, url):
+        try:
+            with urllib.request.urlopen(self.base_url + url) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+
+class DjangoClient:
+    """Тестовый клиент Django в этом же процессе."""
+
+    counts_queries = True
+
+    def __init__(self, user=None):
+        # Адрес вне INTERNAL_IPS, чтобы debug_toolbar не влиял на замеры.
+        self.client = Client(REMOTE_ADDR='192.0.2.1')
+        if user is not None:
+            self.client.force_login(user)
+
+    def get(self, url):
+        return self.client.get(url).status_code
+
+
+def sample_kwargs():
+    """Значения параметров URL: самые нагруженные объекты базы."""
+    author = User.objects.annotate(
+        total=Count('posts')
+    ).order_by('-total').first()
+    reader = User.objects.annotate(
+        total=Count('follower')
+    ).order_by('-total').first()
+    group = Group.objects.annotate(
+        total=Count('posts')
+    ).order_by('-total').first()
+    post = Post.objects.order_by('-comment_count').first()
+    kwargs = {}
+    if author is not None:
+        kwargs['username'] = author.username
+    if group is not None:
+        kwargs['slug'] = group.slug
+    if post is not None:
+        kwargs['post_id'] = post.id
+    if reader is not None:
+        kwargs['uidb64'] = urlsafe_base64_encode(force_bytes(reader.pk))
+        kwargs['token'] = default_token_generator.make_token(reader)
+    return kwargs, reader
+
+
+def iter_urls(kwargs):
+    """(имя, адрес) каждой страницы posts, users и about."""
+    for module in (posts_urls, users_urls, about_urls):
+        for pattern in module.urlpatterns:
+            name = f'{module.app_name}:{pattern.name}'
+            if name in SKIP_URLS:
+                continue
+            params = pattern.pattern.converters.keys()
+            if not set(params) <= kwargs.keys():
+                continue
+            yield name, reverse(
+                name, kwargs={param: kwargs[param] for param in params}
+            )
+
+
+def measure(client, url, requests, warmup=1):
+    for _ in range(warmup):
+        client.get(url)
+    timings = []
+    queries = []
+    statuses = set()
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            statuses.add(client.get(url))
+            timings.append(time.perf_counter() - start)
+        queries.append(len(context))
+    elapsed = time.perf_counter() - started
+    result = {
+        'status': sorted(statuses),
+        'requests': requests,
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'rps': round(requests / elapsed, 1),
+        'queries': None,
+        'max_queries': None,
+    }
+    if client.counts_queries:
+        result['queries'] = round(statistics.mean(queries), 2)
+        result['max_queries'] = max(queries)
+    return result
+
+
+def dataset_size():
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'posts_with_images': Post.objects.exclude(image='').count(),
+        'comments': Comment.objects.count(),
+        'follows': Follow.objects.count(),
+    }
+
+
+def run_benchmark(clients, requests, warmup=1, only=None):
+    """Замеры всех страниц для каждого клиента.
+
+    clients - словарь {метка пользователя: клиент}, only - имена URL,
+    которыми ограничить прогон.
+    """
+    kwargs, _ = sample_kwargs()
+    results = []
+    for name, url in iter_urls(kwargs):
+        if only and name not in only:
+            continue
+        for user, client in clients.items():
+            result = {'name': name, 'url': url, 'user': user}
+            result.update(measure(client, url, requests, warmup))
+            results.append(result)
+    return results
+
+
+def _timings(samples):
+    return {
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+    }
+
+
+def measure_render(client, url, renders, warmup=1):
+    """Время запроса целиком и отдельно повторного рендера его шаблона.
+
+    Запросы, которые шаблон делает при повторном рендере (render_queries),
+    означают, что контекст содержит ленивые queryset или связи без
+    select_related.
+    """
+    with capture_renders() as captured:
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            status = client.get(url)
+            elapsed = time.perf_counter() - start
+    result = {
+        'status': status,
+        'request_ms': round(elapsed * 1000, 3),
+        'request_queries': len(context),
+        'request_sql_ms': round(sum(
+            float(query['time']) * 1000
+            for query in context.captured_queries
+        ), 3),
+        'template': None,
+    }
+    if not captured:
+        return result
+    template, template_context, request = captured[0]
+    for _ in range(warmup):
+        template.render(template_context, request)
+    timings = []
+    with CaptureQueriesContext(connection) as context:
+        for _ in range(renders):
+            start = time.perf_counter()
+            template.render(template_context, request)
+            timings.append(time.perf_counter() - start)
+    result['template'] = template.template.name
+    result['renders'] = renders
+    result.update(_timings(timings))
+    result['render_queries'] = round(len(context) / renders, 2)
+    return result
+
+
+def run_template_benchmark(client, renders, warmup=1, only=None):
+    """Замеры рендера шаблонов страниц FEED_PAGES."""
+    kwargs, _ = sample_kwargs()
+    results = []
+    for name, url in iter_urls(kwargs):
+        if name not in FEED_PAGES or only and name not in only:
+            continue
+        if name == 'posts:search':
+            url = f'{url}?q={SEARCH_QUERY}'
+        result = {'name': name, 'url': url}
+        result.update(measure_render(client, url, renders, warmup))
+        results.append(result)
+    return results
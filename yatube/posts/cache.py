@@ -0,0 +1,80 @@
+"""Кэш ленты главной страницы с версионированием.
+
+Страницы хранятся через core.cache.cached() с текущей версией ленты.
+Сигналы сохранения и удаления постов, групп и комментариев увеличивают
+версию, и все старые страницы становятся устаревшими без перебора
+ключей: первый запрос пересчитывает страницу, остальные на это время
+получают прежнюю.
+
+Страницы групп, авторов и постов целиком кэширует core.page_cache по
+суррогатным ключам из post_keys(), group_key() и author_key().
+
+Вместе с версией запоминается время изменения ленты - по нему API
+отдаёт Last-Modified.
+"""
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+
+from core.cache import bump_version, get_version
+from core.page_cache import purge
+from django.core.cache import cache
+
+FEED = 'posts:feed'
+FEED_MODIFIED = 'posts:feed:modified'
+
+
+def get_feed_version():
+    return get_version(FEED)
+
+
+def bump_feed_version():
+    bump_version(FEED)
+    # Last-Modified с точностью до секунды: каждое изменение сдвигает
+    # время хотя бы на секунду, иначе правка в ту же секунду, что и
+    # прошлый ответ, получила бы 304.
+    modified = math.ceil(time.time())
+    previous = cache.get(FEED_MODIFIED)
+    if previous is not None:
+        modified = max(modified, previous + 1)
+    cache.set(FEED_MODIFIED, modified, None)
+
+
+def get_feed_modified():
+    """Время последнего изменения ленты."""
+    modified = cache.get(FEED_MODIFIED)
+    if modified is None:
+        # Время вытеснено из кэша - считаем, что лента изменилась сейчас.
+        cache.add(FEED_MODIFIED, math.ceil(time.time()), None)
+        modified = cache.get(FEED_MODIFIED)
+    return datetime.fromtimestamp(modified, timezone.utc)
+
+
+def feed_page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'posts:index:{path}'
+
+
+def group_key(slug):
+    return f'group:{slug}'
+
+
+def author_key(username):
+    return f'author:{username}'
+
+
+def post_keys(post_id, username, group_slug=None):
+    """Ключи страницы поста: сам пост, его автор и группа."""
+    keys = [f'post:{post_id}', author_key(username)]
+    if group_slug:
+        keys.append(group_key(group_slug))
+    return keys
+
+
+def purge_post(post_id, username, *group_slugs):
+    """Сбрасывает страницы поста, его автора и групп."""
+    purge(
+        f'post:{post_id}', author_key(username),
+        *(group_key(slug) for slug in group_slugs if slug),
+    )
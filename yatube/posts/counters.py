@@ -0,0 +1,101 @@
+"""Денормализованные счётчики постов, комментариев и подписчиков.
+
+Счётчики меняются атомарно через F()-выражения, без чтения значения
+в Python. Если они разошлись с данными, их пересчитывает
+rebuild_counters.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+
+def change_author_stat(user_id, field, delta):
+    updated = AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    if updated or delta < 0:
+        # При удалении автора его строка уже может быть удалена каскадом.
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(user_id=user_id, **{field: delta})
+    except IntegrityError:
+        # Строку успел создать параллельный запрос.
+        AuthorStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta}
+        )
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(id=post_id).update(
+        comment_count=F('comment_count') + delta
+    )
+
+
+def _counts(queryset, key, ids):
+    return dict(
+        queryset.filter(**{f'{key}__in': ids}).values(key).annotate(
+            total=Count('id')
+        ).values_list(key, 'total')
+    )
+
+
+def recount_posts(ids):
+    """Пересчитывает comment_count у постов с этими id."""
+    comments = _counts(Comment.objects, 'post_id', ids)
+    posts = list(Post.objects.filter(id__in=ids).only('id', 'comment_count'))
+    stale = []
+    for post in posts:
+        actual = comments.get(post.id, 0)
+        if post.comment_count != actual:
+            post.comment_count = actual
+            stale.append(post)
+    Post.objects.bulk_update(stale, ['comment_count'])
+    return len(stale)
+
+
+def recount_authors(ids):
+    """Пересчитывает AuthorStats пользователей с этими id."""
+    posts = _counts(Post.objects, 'author_id', ids)
+    followers = _counts(Follow.objects, 'author_id', ids)
+    existing = AuthorStats.objects.in_bulk(ids)
+    stale = []
+    missing = []
+    for user_id in ids:
+        actual = (posts.get(user_id, 0), followers.get(user_id, 0))
+        stats = existing.get(user_id)
+        if stats is None:
+            missing.append(AuthorStats(
+                user_id=user_id,
+                post_count=actual[0],
+                follower_count=actual[1],
+            ))
+        elif (stats.post_count, stats.follower_count) != actual:
+            stats.post_count, stats.follower_count = actual
+            stale.append(stats)
+    AuthorStats.objects.bulk_update(stale, ['post_count', 'follower_count'])
+    AuthorStats.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(stale) + len(missing)
+
+
+def _rebuild(model, recount, batch_size):
+    ids = model.objects.order_by('id').values_list('id', flat=True)
+    changed = 0
+    last_id = 0
+    while True:
+        batch = list(ids.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return changed
+        last_id = batch[-1]
+        changed += recount(batch)
+
+
+def rebuild_post_counters(batch_size):
+    """Пересчитывает Post.comment_count пачками по id."""
+    return _rebuild(Post, recount_posts, batch_size)
+
+
+def rebuild_author_counters(batch_size):
+    """Пересчитывает AuthorStats пачками по id пользователей."""
+    return _rebuild(User, recount_authors, batch_size)
@@ -0,0 +1,180 @@
+"""Лента подписок с предварительной раскладкой постов (fan-out on write).
+
+Новый пост сразу записывается в FeedEntry каждого подписчика, поэтому
+чтение ленты - выборка по индексу (user, -pub_date). Для авторов,
+у которых подписчиков больше FEED_FANOUT_MAX_FOLLOWERS, раскладка не
+делается: их посты подтягиваются при чтении (гибрид push/pull).
+"""
+from django.conf import settings
+from django.db import connection
+from yatube.paginator import FEED_ORDERING, CursorPaginator
+
+from .models import AuthorStats, FeedEntry, Follow, Post
+
+# Порядок FeedEntry, соответствующий FEED_ORDERING постов.
+ENTRY_ORDERING = ('-pub_date', '-post_id')
+
+
+def is_pull_author(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def _bulk_insert(entries):
+    FeedEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.FEED_FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def push_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    entries = []
+    for user_id in followers.iterator():
+        entries.append(
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        )
+        if len(entries) >= settings.FEED_FANOUT_BATCH_SIZE:
+            _bulk_insert(entries)
+            entries = []
+    _bulk_insert(entries)
+
+
+def push_posts(posts):
+    """Раскладывает пачку постов, созданных без сигналов (импорт).
+
+    Строки лент собираются в базе одним INSERT ... SELECT, объекты
+    FeedEntry в Python не создаются.
+    """
+    ids = [post.id for post in posts]
+    if not ids:
+        return
+    qn = connection.ops.quote_name
+    entry, post, follow, stats = (
+        qn(model._meta.db_table)
+        for model in (FeedEntry, Post, Follow, AuthorStats)
+    )
+    placeholders = ', '.join(['%s'] * len(ids))
+    sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{entry} (user_id, post_id, pub_date) '
+        f'SELECT f.user_id, p.id, p.pub_date FROM {post} p '
+        f'JOIN {follow} f ON f.author_id = p.author_id '
+        f'WHERE p.id IN ({placeholders}) AND p.author_id NOT IN ('
+        f'SELECT user_id FROM {stats} WHERE follower_count > %s)'
+        f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*ids, settings.FEED_FANOUT_MAX_FOLLOWERS])
+
+
+def left_pull(author_id):
+    """Автор только что перестал быть pull-автором."""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        follower_count=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def backfill_author(author_id):
+    """Раскладывает все посты автора по лентам его подписчиков.
+
+    Нужна, когда автор возвращается к раскладке: посты, написанные
+    им в pull-режиме, в FeedEntry не попадали.
+    """
+    posts = Post.objects.filter(author_id=author_id).only('id')
+    batch = []
+    for post in posts.iterator():
+        batch.append(post)
+        if len(batch) >= settings.FEED_FANOUT_BATCH_SIZE:
+            push_posts(batch)
+            batch = []
+    push_posts(batch)
+
+
+def backfill_follow(user_id, author_id):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    if is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    entries = []
+    for post_id, pub_date in posts.iterator():
+        entries.append(
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        )
+        if len(entries) >= settings.FEED_FANOUT_BATCH_SIZE:
+            _bulk_insert(entries)
+            entries = []
+    _bulk_insert(entries)
+
+
+def drop_follow(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Курсорная лента подписок.
+
+    Разложенные посты читаются диапазоном FeedEntry по индексу
+    feed_user_pub_date_idx, посты pull-авторов - отдельным запросом
+    с тем же курсором. Обе выборки ограничены per_page + 1 строками
+    и сливаются по (pub_date, id).
+    """
+
+    def __init__(self, user, per_page):
+        pull_authors = Follow.objects.filter(
+            user=user,
+            author__stats__follower_count__gt=(
+                settings.FEED_FANOUT_MAX_FOLLOWERS
+            ),
+        ).values('author')
+        super().__init__(
+            Post.objects.for_feed().filter(author__in=pull_authors),
+            per_page,
+            FEED_ORDERING,
+        )
+        self.pull_authors = pull_authors
+        self.entries = FeedEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'
+        ).prefetch_related('post__image_variants')
+
+    def _rows(self, values=None, forward=True):
+        entries = self.entries
+        if values is not None:
+            entries = entries.filter(
+                self._beyond(values, forward, ('pub_date', 'post_id'))
+            )
+        ordering = ENTRY_ORDERING if forward else self._reverse(
+            ENTRY_ORDERING
+        )
+        posts = {
+            entry.post_id: entry.post
+            for entry in entries.order_by(*ordering)[:self.per_page + 1]
+        }
+        if self.pull_authors.exists():
+            # Пост мог быть разложен до того, как автор стал pull-автором.
+            for post in super()._rows(values, forward):
+                posts.setdefault(post.id, post)
+        return sorted(
+            posts.values(),
+            key=lambda post: (post.pub_date, post.id),
+            reverse=forward,
+        )[:self.per_page + 1]
+
+
+def follow_page(user, cursor=None, per_page=settings.POSTS_PER_PAGE):
+    """Страница ленты подписок пользователя."""
+    return FollowFeedPaginator(user, per_page).page(cursor)
@@ -0,0 +1,127 @@
+"""Адаптивные варианты картинок постов в современных форматах.
+
+Для каждой картинки строится набор ширин POST_IMAGE_WIDTHS в форматах
+POST_IMAGE_FORMATS с обрезкой по центру до пропорций карточки. Шаблоны
+отдают их через <picture>/srcset, и мобильный клиент скачивает копию
+под свой экран вместо полноразмерного JPEG/PNG.
+
+Имена файлов вариантов содержат хэш содержимого картинки, поэтому
+разные картинки с одинаковым именем файла не делят варианты.
+"""
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import Post, PostImageVariant
+
+PIL_FORMATS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def supported_formats():
+    """Форматы из настроек, которые Pillow умеет сохранять."""
+    Image.init()
+    return [
+        name for name in settings.POST_IMAGE_FORMATS
+        if PIL_FORMATS.get(name) in Image.SAVE
+    ]
+
+
+def variant_name(name, digest, width, fmt):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'posts/variants/{stem}_{digest[:16]}_{width}.{fmt}'
+
+
+def render_variants(name):
+    """Строит варианты картинки. Выполняется в процессе-воркере.
+
+    Возвращает список (ширина, высота, формат, имя файла).
+    """
+    aspect_width, aspect_height = settings.POST_IMAGE_ASPECT
+    with default_storage.open(name) as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    variants = []
+    for fmt in supported_formats():
+        for width in settings.POST_IMAGE_WIDTHS:
+            height = round(width * aspect_height / aspect_width)
+            target = variant_name(name, digest, width, fmt)
+            if not default_storage.exists(target):
+                resized = ImageOps.fit(
+                    image, (width, height), Image.LANCZOS
+                )
+                buffer = io.BytesIO()
+                resized.save(
+                    buffer, PIL_FORMATS[fmt],
+                    quality=settings.POST_IMAGE_QUALITY,
+                )
+                target = default_storage.save(
+                    target, ContentFile(buffer.getvalue())
+                )
+            variants.append((width, height, fmt, target))
+    return variants
+
+
+def _delete_unused(names):
+    """После коммита удаляет файлы, на которые больше нет ссылок."""
+    used = set(
+        PostImageVariant.objects.filter(
+            image__in=names
+        ).values_list('image', flat=True)
+    )
+    for name in set(names) - used:
+        transaction.on_commit(
+            lambda name=name: default_storage.delete(name)
+        )
+
+
+@transaction.atomic
+def store_variants(name, variants):
+    """Заменяет варианты всех постов, у которых сейчас эта картинка."""
+    post_ids = list(
+        Post.objects.filter(image=name).values_list('id', flat=True)
+    )
+    old = PostImageVariant.objects.filter(post_id__in=post_ids)
+    old_names = set(old.values_list('image', flat=True))
+    old.delete()
+    PostImageVariant.objects.bulk_create([
+        PostImageVariant(
+            post_id=post_id,
+            width=width,
+            height=height,
+            format=fmt,
+            image=target,
+        )
+        for post_id in post_ids
+        for width, height, fmt, target in variants
+    ])
+    _delete_unused(old_names)
+
+
+def delete_variants(post_id):
+    """Удаляет варианты поста; файлы - если на них больше нет ссылок."""
+    variants = PostImageVariant.objects.filter(post_id=post_id)
+    names = set(variants.values_list('image', flat=True))
+    variants.delete()
+    _delete_unused(names)
+
+
+def picture_sources(post):
+    """Источники для <picture>: формат и готовая строка srcset."""
+    by_format = {}
+    for variant in post.image_variants.all():
+        by_format.setdefault(variant.format, []).append(
+            f'{variant.image.url} {variant.width}w'
+        )
+    return [
+        {'format': fmt, 'srcset': ', '.join(by_format[fmt])}
+        for fmt in settings.POST_IMAGE_FORMATS
+        if fmt in by_format
+    ]
@@ -0,0 +1,20 @@
+"""Задачи процессов-воркеров картинок.
+
+Процесс запускается методом spawn и импортирует этот модуль до
+django.setup(), поэтому модели и модули, которые их импортируют,
+подключаются только внутри функций.
+"""
+import django
+
+
+def setup():
+    django.setup()
+
+
+def render_image(name):
+    """Миниатюры и варианты для srcset одной картинки."""
+    from .image_variants import render_variants
+    from .thumbnails import render_thumbnails
+
+    name, size, thumbnails = render_thumbnails(name)
+    return name, size, thumbnails, render_variants(name)
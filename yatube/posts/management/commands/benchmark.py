@@ -0,0 +1,104 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts.benchmark import (
+    DjangoClient, HttpClient, dataset_size, run_benchmark, sample_kwargs,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку (p50/p95/p99), число SQL-запросов и пропускную '
+        'способность каждой страницы posts, users и about и пишет JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Сколько раз открыть каждую страницу.',
+        )
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON с результатами, по умолчанию - stdout.',
+        )
+        parser.add_argument(
+            '--base-url',
+            help='Адрес запущенного сервера. Без него страницы открываются '
+                 'тестовым клиентом в этом процессе.',
+        )
+        parser.add_argument(
+            '--url-name',
+            action='append',
+            dest='url_names',
+            help='Замерить только эту страницу, например posts:main.',
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого прогона: вывести изменение p95.',
+        )
+
+    def get_clients(self, base_url):
+        if base_url:
+            return {'anonymous': HttpClient(base_url)}
+        _, reader = sample_kwargs()
+        clients = {'anonymous': DjangoClient()}
+        if reader is not None:
+            clients['authenticated'] = DjangoClient(reader)
+        return clients
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as stream:
+            previous = {
+                (row['name'], row['user']): row
+                for row in json.load(stream)['results']
+            }
+        for row in results:
+            old = previous.get((row['name'], row['user']))
+            if old is None or not old['p95_ms']:
+                continue
+            change = (row['p95_ms'] / old['p95_ms'] - 1) * 100
+            self.stderr.write(
+                f'{row["name"]:32} {row["user"]:13} p95 '
+                f'{old["p95_ms"]:9.2f} -> {row["p95_ms"]:9.2f} мс '
+                f'({change:+.0f}%)'
+            )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть больше нуля')
+        results = run_benchmark(
+            self.get_clients(options['base_url']),
+            options['requests'],
+            options['warmup'],
+            options['url_names'],
+        )
+        report = {
+            'meta': {
+                'started': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'async_views': settings.ASYNC_VIEWS,
+                'client': 'http' if options['base_url'] else 'django',
+                'requests': options['requests'],
+                'dataset': dataset_size(),
+            },
+            'results': results,
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                stream.write(data)
+        else:
+            self.stdout.write(data)
+        if options['compare']:
+            self.compare(options['compare'], results)
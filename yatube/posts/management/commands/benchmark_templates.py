@@ -0,0 +1,69 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.benchmark import (
+    DjangoClient, dataset_size, run_template_benchmark, sample_kwargs,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет рендер шаблонов лент отдельно от представлений и ORM: '
+        'шаблон страницы с готовым контекстом рендерится много раз.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--renders',
+            type=int,
+            default=100,
+            help='Сколько раз рендерить шаблон каждой страницы.',
+        )
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON с результатами, по умолчанию - stdout.',
+        )
+        parser.add_argument(
+            '--url-name',
+            action='append',
+            dest='url_names',
+            help='Замерить только эту страницу, например posts:main.',
+        )
+
+    def handle(self, *args, **options):
+        if options['renders'] < 1:
+            raise CommandError('--renders должен быть больше нуля')
+        # Ленты открываются от имени читателя с подписками: анонимам
+        # страницы отдаются из кэша и шаблон не рендерится.
+        _, reader = sample_kwargs()
+        if reader is None:
+            raise CommandError('База пуста, сначала запустите seed_benchmark')
+        results = run_template_benchmark(
+            DjangoClient(reader),
+            options['renders'],
+            options['warmup'],
+            options['url_names'],
+        )
+        report = {
+            'meta': {
+                'started': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'settings_profile': settings.SETTINGS_PROFILE,
+                'renders': options['renders'],
+                'dataset': dataset_size(),
+            },
+            'results': results,
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                stream.write(data)
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,85 @@
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Открывает страницы приложения posts и выводит план выполнения '
+        '(EXPLAIN) каждого SELECT, чтобы проверить, что индексы работают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='Пользователь, от имени которого открываются страницы.',
+        )
+
+    def get_urls(self, user):
+        urls = [reverse('posts:main')]
+        group = Group.objects.first()
+        if group is not None:
+            urls.append(reverse('posts:group', kwargs={'slug': group.slug}))
+        author = User.objects.filter(posts__isnull=False).first()
+        if author is not None:
+            urls.append(
+                reverse('posts:profile', kwargs={'username': author.username})
+            )
+        post = Post.objects.first()
+        if post is not None:
+            urls.append(
+                reverse('posts:post_detail', kwargs={'post_id': post.id})
+            )
+        if user is not None:
+            urls.append(reverse('posts:follow_index'))
+        return urls
+
+    def handle(self, *args, **options):
+        user = None
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(
+                    f'Пользователь {options["username"]} не найден'
+                )
+        # Адрес вне INTERNAL_IPS, чтобы debug_toolbar не добавлял запросов.
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        if user is not None:
+            client.force_login(user)
+        for url in self.get_urls(user):
+            # Чтения могут уйти на реплики, поэтому слушаем все базы и
+            # строим план там же, где выполнялся запрос.
+            with ExitStack() as stack:
+                contexts = {
+                    alias: stack.enter_context(
+                        CaptureQueriesContext(connections[alias])
+                    )
+                    for alias in connections
+                }
+                response = client.get(url)
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(f'{url} [{response.status_code}]')
+            )
+            for alias, context in contexts.items():
+                self.explain(alias, context.captured_queries)
+
+    def explain(self, alias, queries):
+        connection = connections[alias]
+        prefix = connection.ops.explain_query_prefix()
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            self.stdout.write(f'[{alias}] {sql}')
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}')
+                for row in cursor.fetchall():
+                    self.stdout.write(
+                        '    ' + ' '.join(str(col) for col in row)
+                    )
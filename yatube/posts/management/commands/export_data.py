@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from posts.transfer import (
+    FIELDS, FORMATS, KINDS, export_rows, guess_format, write_rows,
+)
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты, комментарии или подписки в JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS)
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Файл для выгрузки, по умолчанию - stdout.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию - по расширению.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько строк читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        output = options['output']
+        fmt = guess_format(output, options['format'])
+        rows = export_rows(kind, options['chunk_size'])
+        if output == '-':
+            written = write_rows(rows, self.stdout, fmt, FIELDS[kind])
+        else:
+            with open(output, 'w', encoding='utf-8', newline='') as stream:
+                written = write_rows(rows, stream, fmt, FIELDS[kind])
+        self.stderr.write(f'Выгружено записей: {written}')
@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts.transfer import FORMATS, KINDS, Importer, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты, комментарии или подписки из JSONL или CSV '
+        'пачками через bulk_create. Даты публикации берутся из файла.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS)
+        parser.add_argument('path', help='Файл с данными или - для stdin.')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию - по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько записей вставлять одним запросом.',
+        )
+        parser.add_argument(
+            '--create-missing',
+            action='store_true',
+            help='Создавать неизвестных авторов и группы, а не пропускать.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = guess_format(path, options['format'])
+        importer = Importer(
+            options['kind'], options['batch_size'], options['create_missing']
+        )
+        try:
+            if path == '-':
+                imported, skipped = importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(path, encoding='utf-8', newline='') as stream:
+                    imported, skipped = importer.run(read_rows(stream, fmt))
+        except (IntegrityError, KeyError, ValueError) as error:
+            raise CommandError(f'Импорт отменён: {error!r}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено записей: {imported}, пропущено: {skipped}'
+        ))
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import as_completed
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.image_worker import render_image
+from posts.thumbnails import create_executor, store_image
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит миниатюры и варианты для srcset для уже загруженных '
+        'картинок, например после деплоя на пустой кэш.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, по умолчанию - число ядер.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько картинок отдавать пулу за раз.',
+        )
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            help='Только посты, у которых ещё нет вариантов картинки.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if options['missing_only']:
+            posts = posts.filter(image_variants__isnull=True)
+        names = posts.order_by().values_list('image', flat=True).distinct()
+        names = names.iterator()
+        done = failed = 0
+        with create_executor(options['workers']) as executor:
+            # Задачи ставятся пачками, чтобы очередь пула не росла
+            # вместе с числом картинок.
+            while True:
+                batch = list(islice(names, options['batch_size']))
+                if not batch:
+                    break
+                futures = {
+                    executor.submit(render_image, name): name
+                    for name in batch
+                }
+                for future in as_completed(futures):
+                    try:
+                        store_image(*future.result())
+                    except Exception as error:
+                        failed += 1
+                        self.stderr.write(f'{futures[future]}: {error}')
+                    else:
+                        done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {done}, ошибок: {failed}'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild_author_counters, rebuild_post_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики: комментарии поста, '
+        'посты и подписчиков автора.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = rebuild_post_counters(batch_size)
+        authors = rebuild_author_counters(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: постов {posts}, авторов {authors}'
+        ))
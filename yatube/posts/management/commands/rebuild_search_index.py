@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс по тексту всех постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов индексировать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {indexed}'
+        ))
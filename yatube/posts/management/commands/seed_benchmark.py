@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import Seeder, dataset_size
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими пользователями, подписками, постами '
+        'и комментариями для нагрузочных прогонов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--follows-per-user',
+            type=int,
+            default=20,
+            help='Среднее число подписок у пользователя.',
+        )
+        parser.add_argument(
+            '--comments-per-post',
+            type=int,
+            default=2,
+            help='Среднее число комментариев к посту.',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель закона Ципфа для популярности авторов.',
+        )
+        parser.add_argument(
+            '--image-share',
+            type=float,
+            default=0.1,
+            help='Доля постов с картинкой.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='bench',
+            help='Префикс имён пользователей и slug групп.',
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Данные с префиксом {prefix} уже есть, выберите другой.'
+            )
+        seeder = Seeder(
+            users=options['users'],
+            posts=options['posts'],
+            groups=options['groups'],
+            follows_per_user=options['follows_per_user'],
+            comments_per_post=options['comments_per_post'],
+            skew=options['skew'],
+            image_share=options['image_share'],
+            batch_size=options['batch_size'],
+            random_seed=options['random_seed'],
+            prefix=prefix,
+        )
+        started = time.perf_counter()
+        seeder.run()
+        elapsed = time.perf_counter() - started
+        sizes = ', '.join(
+            f'{name}: {count}' for name, count in dataset_size().items()
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с. В базе {sizes}'
+        ))
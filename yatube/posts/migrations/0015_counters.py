@@ -0,0 +1,65 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    comments = Comment.objects.values('post_id').annotate(total=Count('id'))
+    for row in comments.iterator():
+        Post.objects.filter(id=row['post_id']).update(
+            comment_count=row['total']
+        )
+    posts = dict(
+        Post.objects.values('author_id').annotate(
+            total=Count('id')
+        ).values_list('author_id', 'total')
+    )
+    followers = dict(
+        Follow.objects.values('author_id').annotate(
+            total=Count('id')
+        ).values_list('author_id', 'total')
+    )
+    AuthorStats.objects.bulk_create(
+        [
+            AuthorStats(
+                user_id=user_id,
+                post_count=posts.get(user_id, 0),
+                follower_count=followers.get(user_id, 0),
+            )
+            for user_id in User.objects.values_list('id', flat=True)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0014_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('follower_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
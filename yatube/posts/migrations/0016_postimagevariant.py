@@ -0,0 +1,29 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('format', models.CharField(max_length=10, verbose_name='Формат')),
+                ('image', models.ImageField(upload_to='posts/variants/', verbose_name='Картинка')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='posts.Post')),
+            ],
+            options={
+                'ordering': ('format', 'width'),
+                'unique_together': {('post', 'format', 'width')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Индекс существующих постов строит команда rebuild_search_index: миграция
+# не зависит от токенизатора и стеммера, которые ещё могут поменяться.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_postimagevariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='Вхождений')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='posts.Post')),
+            ],
+            options={
+                'unique_together': {('term', 'post')},
+            },
+        ),
+    ]
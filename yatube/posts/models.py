@@ -6,6 +6,15 @@ from core.models import CreatedModel
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа загружаются тем же запросом,
+        варианты картинок - одним дополнительным на страницу."""
+        return self.select_related('author', 'group').prefetch_related(
+            'image_variants'
+        )
+
+
 class Post(CreatedModel):
     text = models.TextField(
         'Текст поста',
@@ -31,9 +40,33 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    # Счётчик поддерживается сигналами, пересчёт - rebuild_counters.
+    comment_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date"]
+        # Составные индексы под фильтр + сортировку лент
+        # и курсор (pub_date, id).
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -68,6 +101,12 @@ class Comment(CreatedModel):
 
     class Meta:
         verbose_name = "Комментарий"
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date', 'id'],
+                name='comment_post_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -84,3 +123,88 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow',
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Запись в ленте подписок: пост автора, разложенный подписчику."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    # Копия Post.pub_date, чтобы страница ленты читалась по индексу.
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx',
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    post_count = models.PositiveIntegerField('Постов', default=0)
+    follower_count = models.PositiveIntegerField('Подписчиков', default=0)
+
+    def __str__(self):
+        return f'{self.user}: {self.post_count}/{self.follower_count}'
+
+
+class PostImageVariant(models.Model):
+    """Уменьшенная копия картинки поста для srcset."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+    )
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+    format = models.CharField('Формат', max_length=10)
+    image = models.ImageField('Картинка', upload_to='posts/variants/')
+
+    class Meta:
+        ordering = ('format', 'width')
+        unique_together = ('post', 'format', 'width')
+
+    def __str__(self):
+        return f'{self.image} ({self.format}, {self.width}w)'
+
+
+class SearchEntry(models.Model):
+    """Строка обратного индекса: основа слова и пост, где она встречается."""
+    term = models.CharField('Основа', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_entries',
+    )
+    weight = models.PositiveSmallIntegerField('Вхождений', default=1)
+
+    class Meta:
+        unique_together = ('term', 'post')
+
+    def __str__(self):
+        return f'{self.term}: {self.post_id}'
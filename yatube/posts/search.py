@@ -0,0 +1,190 @@
+"""Полнотекстовый поиск по постам на обратном индексе в базе данных.
+
+Текст поста разбивается на слова, каждое слово приводится к основе
+стеммером Snowball для русского языка, и в SearchEntry записывается
+пара (основа, пост) с числом вхождений. Поиск находит посты, в которых
+есть все основы запроса, и ранжирует их по сумме вхождений.
+"""
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Post, SearchEntry
+
+TERM_MAX_LENGTH = 64
+WORD_RE = re.compile(r'[0-9a-zа-яё]+')
+STOP_WORDS = frozenset(
+    'а без бы был была были было в вам вас во вот все всё вы где да для '
+    'до его ее её же за и из или им их к как ко ли мне мы на над не нет '
+    'ни но о об он она они оно от по под при с со так то ты у уже чем '
+    'что это я'.split()
+)
+
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND_1 = ('в', 'вши', 'вшись')
+PERFECTIVE_GERUND_2 = ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = (
+    'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+    'ют', 'ны', 'ть', 'ешь', 'нно',
+)
+VERB_2 = (
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+    'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+    'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+)
+SUPERLATIVE = ('ейш', 'ейше')
+DERIVATIONAL = ('ост', 'ость')
+
+
+def _regions(word):
+    """Начала областей RV и R2 алгоритма Snowball."""
+    rv = r1 = r2 = len(word)
+    for i, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _among(word, start, endings, after_a=()):
+    """Отрезает самое длинное окончание, целиком лежащее после start.
+
+    Окончания из after_a отрезаются, только если перед ними стоит
+    "а" или "я"; иначе шаг не выполняется. Возвращает None, если
+    отрезать нечего.
+    """
+    candidates = sorted(endings + after_a, key=len, reverse=True)
+    for ending in candidates:
+        cut = len(word) - len(ending)
+        if cut < start or not word.endswith(ending):
+            continue
+        if ending in after_a:
+            if cut - 1 >= start and word[cut - 1] in 'ая':
+                return word[:cut]
+            return None
+        return word[:cut]
+    return None
+
+
+def _adjectival(word, start):
+    word = _among(word, start, ADJECTIVE)
+    if word is None:
+        return None
+    participle = _among(word, start, PARTICIPLE_2, PARTICIPLE_1)
+    return word if participle is None else participle
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Основа русского слова по алгоритму Snowball (Porter)."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    result = _among(word, rv, PERFECTIVE_GERUND_2, PERFECTIVE_GERUND_1)
+    if result is None:
+        reflexive = _among(word, rv, REFLEXIVE)
+        if reflexive is not None:
+            word = reflexive
+        for step in (
+            lambda w: _adjectival(w, rv),
+            lambda w: _among(w, rv, VERB_2, VERB_1),
+            lambda w: _among(w, rv, NOUN),
+        ):
+            result = step(word)
+            if result is not None:
+                word = result
+                break
+    else:
+        word = result
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    derivational = _among(word, r2, DERIVATIONAL)
+    if derivational is not None:
+        word = derivational
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        return word[:-1]
+    superlative = _among(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith('нн') and len(word) - 2 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def terms(text):
+    """Основы слов текста с числом вхождений."""
+    counter = Counter()
+    for word in WORD_RE.findall(text.lower()):
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        counter[stem(word)[:TERM_MAX_LENGTH]] += 1
+    return counter
+
+
+def search_posts(query):
+    """Посты, содержащие все слова запроса, с аннотацией rank."""
+    # Пустой список term__in Django отсекает без запроса к базе.
+    query_terms = set(terms(query))
+    return Post.objects.filter(
+        search_entries__term__in=query_terms
+    ).annotate(
+        rank=Sum('search_entries__weight'),
+        matched=Count('search_entries'),
+    ).filter(matched=len(query_terms))
+
+
+def index_posts(posts):
+    """Перестраивает строки индекса для пачки постов."""
+    with transaction.atomic():
+        SearchEntry.objects.filter(post__in=posts).delete()
+        SearchEntry.objects.bulk_create([
+            SearchEntry(term=term, post=post, weight=min(count, 32767))
+            for post in posts
+            for term, count in terms(post.text).items()
+        ])
+
+
+def index_post(post):
+    """Перестраивает строки индекса для одного поста."""
+    index_posts([post])
+
+
+def rebuild_search_index(batch_size):
+    """Перестраивает индекс всех постов пачками по id."""
+    posts = Post.objects.order_by('id').only('id', 'text')
+    indexed = 0
+    last_id = 0
+    while True:
+        batch = list(posts.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return indexed
+        last_id = batch[-1].id
+        index_posts(batch)
+        indexed += len(batch)
@@ -0,0 +1,186 @@
+from core import counts
+from core.page_cache import purge
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from . import counters, feed, image_variants, search
+from .cache import author_key, bump_feed_version, group_key, purge_post
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=Post)
+def push_new_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора."""
+    if created and not raw:
+        feed.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post_text(sender, instance, created, raw=False,
+                    update_fields=None, **kwargs):
+    """Поисковый индекс обновляется, только если менялся текст."""
+    if raw or (update_fields is not None and 'text' not in update_fields):
+        return
+    search.index_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed_on_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.backfill_follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_feed_on_unfollow(sender, instance, **kwargs):
+    feed.drop_follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_feed_cache(sender, **kwargs):
+    """Любое изменение, видимое в ленте, сбрасывает её кэш."""
+    bump_feed_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_post_counts(sender, raw=False, **kwargs):
+    """Посты и подписки меняют число страниц лент."""
+    if not raw:
+        counts.invalidate(Post)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    """Запоминает прежнюю группу поста, чтобы сбросить и её страницу."""
+    instance._old_group_slug = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'group' not in update_fields:
+        return
+    instance._old_group_slug = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('group__slug', flat=True).first()
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_image(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    """Запоминает прежнюю картинку поста, чтобы убрать её варианты."""
+    instance._old_image = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    instance._old_image = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def drop_old_variants(sender, instance, raw=False, **kwargs):
+    """Варианты заменённой или убранной картинки больше не показываются."""
+    old_image = getattr(instance, '_old_image', None)
+    if not raw and old_image and old_image != instance.image.name:
+        image_variants.delete_variants(instance.pk)
+
+
+@receiver(pre_delete, sender=Post)
+def delete_post_variants(sender, instance, **kwargs):
+    image_variants.delete_variants(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    purge_post(
+        instance.id, instance.author.username,
+        instance.group.slug if instance.group_id else None,
+        getattr(instance, '_old_group_slug', None),
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, raw=False, **kwargs):
+    """Счётчик комментариев виден на страницах поста, автора и группы."""
+    if raw:
+        return
+    post = Post.objects.filter(id=instance.post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if post is not None:
+        purge_post(instance.post_id, *post)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        purge(group_key(instance.slug))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_author_pages(sender, instance, raw=False, **kwargs):
+    """Число подписчиков видно на странице автора."""
+    if not raw:
+        purge(author_key(instance.author.username))
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_author_stat(instance.author_id, 'post_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_author_stat(instance.author_id, 'post_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follower(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_author_stat(
+            instance.author_id, 'follower_count', 1
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def count_lost_follower(sender, instance, **kwargs):
+    counters.change_author_stat(instance.author_id, 'follower_count', -1)
+    if feed.left_pull(instance.author_id):
+        # После коммита: если подписка удаляется вместе с автором,
+        # его посты к тому моменту удалены и раскладывать нечего.
+        author_id = instance.author_id
+        transaction.on_commit(lambda: feed.backfill_author(author_id))
@@ -0,0 +1,24 @@
+from core.metrics import timer
+from django import template
+
+from ..image_variants import picture_sources
+from ..thumbnails import get_thumbnail_url
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, preset='card'):
+    """Картинка поста: готовая миниатюра, пока её нет - оригинал.
+
+    Варианты для srcset берутся из post.image_variants, поэтому
+    в лентах их нужно загружать через prefetch_related.
+    """
+    if not post.image:
+        return {'image_url': None}
+    with timer('thumbnail'):
+        url = get_thumbnail_url(post.image, preset)
+        return {
+            'image_url': url or post.image.url,
+            'sources': picture_sources(post),
+        }
@@ -4,16 +4,40 @@ from django.conf import settings
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
 
+from contextlib import contextmanager
+from unittest import mock
 import tempfile
 import shutil
 
-from ..models import Post, Group, Follow, User
+from ..feed import follow_page
+from ..models import AuthorStats, Post, Group, Comment, Follow, User
+from core import counts
+from yatube.paginator import LAST_PAGE, FeedPaginator
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+class QueryBudgetMixin:
+    """Проверка, что код укладывается в бюджет SQL-запросов."""
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(
+                query['sql'] for query in context.captured_queries
+            )
+            self.fail(
+                f'{len(context)} запросов при бюджете {budget}:\n{queries}'
+            )
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostViewsTests(TestCase):
     @classmethod
@@ -288,16 +312,29 @@ class PostViewsTests(TestCase):
         content = response.content
         context = response.context['page_obj']
         self.assertIn(self.post, context)
+        # Повторный анонимный запрос отдаётся из кэша без обращения к БД
+        with self.assertNumQueries(0):
+            second_response = self.unauthorized_user.get(
+                reverse('posts:main')
+            )
+        self.assertEqual(content, second_response.content)
+        # Удаление поста сразу сбрасывает кэш ленты
         post = Post.objects.get(id=self.post.id)
         post.delete()
         second_response = self.unauthorized_user.get(reverse('posts:main'))
         second_content = second_response.content
-        self.assertEqual(content, second_content)
-        cache.clear()
-        second_response = self.unauthorized_user.get(reverse('posts:main'))
-        second_content = second_response.content
         self.assertNotEqual(content, second_content)
 
+    def test_edit_is_visible_on_cached_index(self):
+        '''Правка поста сразу видна на закэшированной главной'''
+        self.unauthorized_user.get(reverse('posts:main'))
+        self.post_author.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Исправленный пост', 'group': self.group.id},
+        )
+        response = self.unauthorized_user.get(reverse('posts:main'))
+        self.assertContains(response, 'Исправленный пост')
+
     def test_auth_user_can_follow(self):
         '''Авторизованный пользователь может подписываться на других
         пользователей'''
@@ -332,6 +369,141 @@ class PostViewsTests(TestCase):
         self.assertEqual(Follow.objects.count(), 0)
 
 
+class FollowFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Старый пост',
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_fills_and_unfollow_clears_feed(self):
+        '''Подписка раскладывает посты автора в ленту, отписка убирает'''
+        self.reader_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(self.feed(), [self.old_post])
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_posts_are_pulled(self):
+        '''Посты популярного автора читаются без раскладки по лентам'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertFalse(new_post.feed_entries.exists())
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_pulled_posts_stay_after_return_to_push(self):
+        '''Посты pull-режима раскладываются, когда автор теряет подписчиков'''
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        pulled = Post.objects.create(author=self.author, text='Pull')
+        self.assertFalse(pulled.feed_entries.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(user=other).delete()
+        self.assertTrue(pulled.feed_entries.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [pulled, self.old_post])
+
+    def test_pushed_and_pulled_posts_share_cursor(self):
+        '''Разложенные посты и посты pull-автора сливаются по курсору'''
+        popular = User.objects.create_user(username='popular')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=popular)
+        AuthorStats.objects.filter(user=popular).update(
+            follower_count=settings.FEED_FANOUT_MAX_FOLLOWERS + 1
+        )
+        for i in range(3):
+            Post.objects.create(author=popular, text=f'Pull {i}')
+            Post.objects.create(author=self.author, text=f'Push {i}')
+        expected = list(
+            Post.objects.filter(author__in=[self.author, popular])
+            .order_by('-pub_date', '-id')
+        )
+        seen = []
+        page = follow_page(self.reader, per_page=2)
+        while True:
+            seen += list(page)
+            if not page.has_next():
+                break
+            page = follow_page(self.reader, page.next_cursor, per_page=2)
+        self.assertEqual(seen, expected)
+        back = follow_page(self.reader, page.previous_cursor, per_page=2)
+        self.assertEqual(list(back), expected[4:6])
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.once = Post.objects.create(
+            author=cls.author,
+            text='Красивая кошка спит на окне',
+        )
+        cls.twice = Post.objects.create(
+            author=cls.author,
+            text='Кошки и кошка: две красивых кошки',
+        )
+        Post.objects.create(author=cls.author, text='Собака лает')
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_search_matches_word_forms_and_ranks(self):
+        '''Поиск находит все формы слова, частые совпадения выше'''
+        self.assertEqual(
+            list(self.search('кошками')), [self.twice, self.once]
+        )
+        self.assertEqual(list(self.search('красивые кошки')),
+                         [self.twice, self.once])
+        self.assertEqual(list(self.search('кошка собака')), [])
+        self.assertEqual(list(self.search('')), [])
+
+    def test_edit_reindexes_post(self):
+        '''После правки текста пост ищется по новым словам'''
+        self.once.text = 'Рыжий кот'
+        self.once.save(update_fields=['text'])
+        self.assertEqual(list(self.search('кошка')), [self.twice])
+        self.assertEqual(list(self.search('рыжего')), [self.once])
+
+    def test_search_pages_with_cursor(self):
+        '''Результаты листаются курсором, запрос остаётся в ссылках'''
+        for _ in range(settings.POSTS_PER_PAGE):
+            Post.objects.create(author=self.author, text='Кошка')
+        response = self.client.get(reverse('posts:search'), {'q': 'кошка'})
+        page_obj = response.context['page_obj']
+        self.assertContains(
+            response, '?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0&amp;cursor='
+        )
+        self.assertEqual(page_obj[0], self.twice)
+        second = self.search('кошка', cursor=page_obj.next_cursor)
+        self.assertEqual(list(second)[-1], self.once)
+        self.assertEqual(
+            len(page_obj) + len(second), settings.POSTS_PER_PAGE + 2
+        )
+
+
 class PostPaginatorTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -351,6 +523,9 @@ class PostPaginatorTests(TestCase):
             )
             object_list.append(cls.post)
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records_index(self):
         """Проверка паджинатора страниц"""
         paginator = [
@@ -370,3 +545,210 @@ class PostPaginatorTests(TestCase):
                 .object_list.count(),
                 response.context['page_obj'].paginator.per_page
             )
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсорная пагинация проходит ленту без пропусков и повторов."""
+        first = self.client.get(reverse('posts:main'))
+        page_obj = first.context['page_obj']
+        seen = [post.id for post in page_obj]
+        second = self.client.get(
+            reverse('posts:main'), {'cursor': page_obj.next_cursor}
+        )
+        cursor_page = second.context['page_obj']
+        seen += [post.id for post in cursor_page]
+        self.assertEqual(
+            seen,
+            list(Post.objects.order_by('-pub_date', '-id')
+                 .values_list('id', flat=True))
+        )
+        self.assertFalse(cursor_page.has_next())
+        back = self.client.get(
+            reverse('posts:main'),
+            {'cursor': cursor_page.previous_cursor}
+        )
+        self.assertEqual(
+            [post.id for post in back.context['page_obj']], seen[:10]
+        )
+
+    def test_page_range_is_windowed(self):
+        """Номера страниц - окно вокруг текущей и последняя."""
+        paginator = FeedPaginator(Post.objects.all(), 2, window=1)
+        page = paginator.page(1)
+        self.assertEqual(len(page), 2)
+        self.assertTrue(paginator.count_is_exact)
+        self.assertEqual(
+            page.page_range, [1, 2, paginator.ELLIPSIS, 6]
+        )
+        self.assertEqual(
+            paginator.page(4).page_range,
+            [1, paginator.ELLIPSIS, 3, 4, 5, 6],
+        )
+        # COUNT(*) уже в кэше: только проба окна и сама страница.
+        with self.assertNumQueries(2):
+            page = FeedPaginator(Post.objects.all(), 2, window=1).page(1)
+            self.assertEqual(page.paginator.num_pages, 6)
+            self.assertEqual(len(page), 2)
+        Post.objects.create(author=self.user, text='Ещё пост')
+        paginator = FeedPaginator(Post.objects.all(), 2, window=1)
+        self.assertEqual(paginator.page(1).paginator.num_pages, 7)
+
+    @override_settings(COUNT_ESTIMATE_MIN=10)
+    def test_large_feed_uses_planner_estimate(self):
+        """Для большой таблицы берётся оценка, точный count - лениво."""
+        with connections['default'].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = FeedPaginator(Post.objects.all(), 2, window=1)
+        page = paginator.page(1)
+        self.assertFalse(paginator.count_is_exact)
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.page_range, [1, 2, paginator.ELLIPSIS])
+        self.assertEqual(
+            paginator.page(4).page_range,
+            [1, paginator.ELLIPSIS, 3, 4, 5, paginator.ELLIPSIS],
+        )
+        self.assertTrue(paginator.page(5).paginator.count_is_exact)
+        last = FeedPaginator(Post.objects.all(), 2, window=1).page(LAST_PAGE)
+        self.assertEqual(last.number, 6)
+        self.assertFalse(last.has_next())
+
+    def test_overestimated_count_does_not_hide_real_end(self):
+        """Завышенная оценка не даёт пустых страниц за концом ленты."""
+        with mock.patch.object(counts, 'count', return_value=(1000, False)):
+            paginator = FeedPaginator(Post.objects.all(), 2, window=1)
+            self.assertTrue(paginator.page(1).has_next())
+            with self.assertRaises(EmptyPage):
+                paginator.page(8)
+            self.assertTrue(paginator.count_is_exact)
+            last = FeedPaginator(Post.objects.all(), 2, window=1)
+            self.assertEqual(last.page(2).page_range[-1], last.ELLIPSIS)
+            self.assertEqual(last.page(LAST_PAGE).number, 6)
+
+    def test_profile_uses_author_counter(self):
+        """Лента автора берёт количество постов из AuthorStats."""
+        with CaptureQueriesContext(connections['default']) as context:
+            self.client.get(
+                reverse('posts:profile', kwargs={'username': 'auth'})
+            )
+        self.assertFalse(
+            [query for query in context if 'COUNT(' in query['sql']]
+        )
+
+    def test_last_page_link(self):
+        """Ссылка на последнюю страницу не требует знать её номер."""
+        response = self.client.get(reverse('posts:main'), {'page': 'last'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(len(page_obj), 2)
+        self.assertContains(self.client.get(reverse('posts:main')),
+                            '?page=last')
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор отдаёт первую страницу."""
+        response = self.client.get(
+            reverse('posts:group', kwargs={'slug': 'test-slug'}),
+            {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class PostQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # Бюджет не зависит от числа постов на странице.
+    LIST_PAGE_BUDGET = 8
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.author = None
+        for i in range(12):
+            author = User.objects.create_user(
+                username=f'author_{i}', first_name=f'Автор {i}'
+            )
+            cls.author = cls.author or author
+            post = Post.objects.create(
+                author=cls.author if i % 2 else author,
+                text=f'Пост {i}',
+                group=cls.group,
+            )
+            Comment.objects.create(post=post, author=author, text='Да')
+            Follow.objects.get_or_create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_list_pages_fit_query_budget(self):
+        """Ленты не делают запросов на каждый пост."""
+        urls = [
+            reverse('posts:main'),
+            reverse('posts:group', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author_0'}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertMaxQueries(self.LIST_PAGE_BUDGET):
+                    response = self.reader_client.get(url)
+                self.assertGreater(len(response.context['page_obj']), 5)
+
+    def test_feed_shows_comment_count(self):
+        """Число комментариев берётся из поля comment_count поста."""
+        response = self.reader_client.get(reverse('posts:main'))
+        self.assertEqual(response.context['page_obj'][0].comment_count, 1)
+
+
+class CommentPaginationTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for i in range(settings.COMMENTS_PER_PAGE + 5):
+            commenter = User.objects.create_user(username=f'reader_{i}')
+            Comment.objects.create(
+                post=cls.post, author=commenter, text=f'Комментарий {i}'
+            )
+        cls.url = reverse('posts:post_detail', args=[cls.post.id])
+
+    def setUp(self):
+        # Страница поста у анонима кэшируется целиком.
+        cache.clear()
+
+    def test_comments_are_paged_without_per_comment_queries(self):
+        '''Комментарии листаются курсором, авторы грузятся одним JOIN'''
+        with self.assertMaxQueries(6):
+            response = self.client.get(self.url)
+        first = response.context['comments']
+        self.assertEqual(len(first), settings.COMMENTS_PER_PAGE)
+        self.assertEqual(first[0].text, 'Комментарий 0')
+        second = self.client.get(
+            self.url, {'cursor': first.next_cursor}
+        ).context['comments']
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next())
+
+    def test_newer_comments_endpoint(self):
+        '''JSON-эндпоинт отдаёт только комментарии после курсора'''
+        first = self.client.get(self.url).context['comments']
+        response = self.client.get(self.url, {'cursor': first.next_cursor})
+        cursor = response.context['newer_cursor']
+        comments_url = reverse('posts:post_comments', args=[self.post.id])
+        data = self.client.get(comments_url, {'cursor': cursor}).json()
+        self.assertEqual(data['comments'], [])
+        self.assertEqual(data['cursor'], cursor)
+        Comment.objects.create(post=self.post, author=self.author, text='Ещё')
+        data = self.client.get(comments_url, {'cursor': cursor}).json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']], ['Ещё']
+        )
+        self.assertEqual(data['comments'][0]['author'], 'author')
+        self.assertNotEqual(data['cursor'], cursor)
+        self.assertEqual(self.client.get(
+            reverse('posts:post_comments', args=[0])
+        ).status_code, 404)
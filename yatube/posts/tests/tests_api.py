@@ -0,0 +1,198 @@
+import json
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Follow, Group, Post, User
+
+
+class PostApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def send(self, client, method, url, data):
+        return getattr(client, method)(
+            url, json.dumps(data), content_type='application/json'
+        )
+
+    def test_lists_return_compact_posts(self):
+        """Ленты отдают посты без HTML, листаются курсором."""
+        urls = [
+            reverse('api:posts'),
+            reverse('api:group_posts', args=['group']),
+            reverse('api:user_posts', args=['author']),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(data['results'][0], {
+                    'id': self.post.id,
+                    'text': 'Пост',
+                    'author': 'author',
+                    'group': 'group',
+                    'pub_date': self.post.pub_date.isoformat(),
+                    'image': None,
+                    'comment_count': 0,
+                })
+                self.assertIsNone(data['next'])
+        self.assertEqual(
+            self.client.get(reverse('api:group_posts', args=['no'])
+                            ).status_code,
+            404,
+        )
+
+    def test_unchanged_feed_is_not_modified(self):
+        """Повторный запрос с ETag получает 304 без запросов к базе."""
+        url = reverse('api:posts')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.post.text = 'Правка'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Правка')
+
+    def test_edit_changes_last_modified(self):
+        """Правка поста меняет Last-Modified даже в ту же секунду."""
+        url = reverse('api:posts')
+        modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
+        self.post.text = 'Правка'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_and_edit_post(self):
+        """Создать пост может пользователь, править - только автор."""
+        url = reverse('api:posts')
+        self.assertEqual(
+            self.send(self.client, 'post', url, {'text': 'Нет'}).status_code,
+            401,
+        )
+        response = self.send(
+            self.author_client, 'post', url,
+            {'text': 'Новый', 'group': 'group'},
+        )
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(id=response.json()['id'])
+        self.assertEqual((post.author, post.group), (self.author, self.group))
+        detail = reverse('api:post_detail', args=[post.id])
+        self.assertEqual(
+            self.send(self.reader_client, 'patch', detail, {'text': 'Чужой'})
+            .status_code,
+            403,
+        )
+        response = self.send(
+            self.author_client, 'patch', detail, {'group': 'missing'}
+        )
+        self.assertIn('group', response.json()['errors'])
+        response = self.send(
+            self.author_client, 'patch', detail, {'text': 'Исправлен'}
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.group), ('Исправлен', self.group))
+
+    def test_patch_with_form_data(self):
+        """PATCH принимает форму в теле, файлы в PATCH - нет."""
+        detail = reverse('api:post_detail', args=[self.post.id])
+        response = self.author_client.patch(
+            detail, urlencode({'text': 'Из формы'}),
+            content_type='application/x-www-form-urlencoded',
+        )
+        self.assertEqual(response.json()['text'], 'Из формы')
+        response = self.author_client.patch(
+            detail, 'text=x', content_type='multipart/form-data; boundary=b'
+        )
+        self.assertEqual(response.status_code, 415)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Из формы')
+
+    def test_token_auth_skips_csrf(self):
+        """Запросы с токеном не требуют CSRF, с сессией - требуют."""
+        self.author.set_password('secret')
+        self.author.save()
+        url = reverse('api:posts')
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(
+            self.send(client, 'post', reverse('api:token'), {
+                'username': 'author', 'password': 'wrong',
+            }).status_code,
+            400,
+        )
+        token = self.send(client, 'post', reverse('api:token'), {
+            'username': 'author', 'password': 'secret',
+        }).json()['token']
+        response = client.post(
+            url, json.dumps({'text': 'С токеном'}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {token}',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['author'], 'author')
+        client.force_login(self.author)
+        self.assertEqual(
+            self.send(client, 'post', url, {'text': 'Сессия'}).status_code,
+            403,
+        )
+        self.author.set_password('changed')
+        self.author.save()
+        response = client.get(
+            reverse('api:follow_posts'), HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_comments(self):
+        """Комментарии читаются анонимом и добавляются пользователем."""
+        url = reverse('api:post_comments', args=[self.post.id])
+        response = self.send(self.reader_client, 'post', url, {'text': 'Да'})
+        self.assertEqual(response.status_code, 201)
+        data = self.client.get(url).json()
+        self.assertEqual(
+            [(c['author'], c['text']) for c in data['results']],
+            [('reader', 'Да')],
+        )
+        self.assertEqual(
+            self.send(self.reader_client, 'post', url, {}).status_code, 400
+        )
+
+    def test_follow_and_follow_feed(self):
+        """Подписка через API меняет ETag ленты подписок."""
+        feed_url = reverse('api:follow_posts')
+        follow_url = reverse('api:follow', args=['author'])
+        self.assertEqual(self.client.get(feed_url).status_code, 401)
+        response = self.reader_client.get(feed_url)
+        self.assertEqual(response.json()['results'], [])
+        etag = response['ETag']
+        response = self.reader_client.post(follow_url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.reader_client.post(follow_url).status_code, 200)
+        response = self.reader_client.get(
+            feed_url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], self.post.id)
+        self.reader_client.delete(follow_url)
+        self.assertFalse(Follow.objects.filter(user=self.reader).exists())
@@ -0,0 +1,73 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, TransactionTestCase
+
+from .. import async_views
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+class AsyncViewsTests(TransactionTestCase):
+    # Запросы async-представлений идут из потоков пула со своими
+    # соединениями, поэтому данные должны быть закоммичены.
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.post = Post.objects.create(
+            author=self.author, text='Асинхронный пост', group=self.group
+        )
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий читателя'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def call(self, view, *args, user=None, path='/'):
+        request = RequestFactory().get(path)
+        request.user = user or AnonymousUser()
+        return async_to_sync(view)(request, *args)
+
+    def test_pages_render(self):
+        """Async-представления отдают те же страницы, что и синхронные."""
+        cases = [
+            (async_views.index, (), 'Асинхронный пост'),
+            (async_views.group_posts, ('group',), 'Асинхронный пост'),
+            (async_views.profile, ('author',), 'Асинхронный пост'),
+            (async_views.post_detail, (self.post.id,),
+             'Комментарий читателя'),
+        ]
+        for view, args, text in cases:
+            with self.subTest(view=view.__name__):
+                response = self.call(view, *args, user=self.reader)
+                self.assertContains(response, text)
+        response = self.call(async_views.follow_index, user=self.reader)
+        self.assertContains(response, 'Асинхронный пост')
+
+    def test_missing_objects_and_anonymous_follow(self):
+        """404 для несуществующих объектов, аноним уходит на вход."""
+        for view, args in ((async_views.group_posts, ('none',)),
+                           (async_views.profile, ('none',)),
+                           (async_views.post_detail, (0,))):
+            with self.subTest(view=view.__name__):
+                with self.assertRaises(Http404):
+                    self.call(view, *args)
+        response = self.call(async_views.follow_index, path='/follow/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('next=/follow/', response.url)
+
+    def test_anonymous_index_is_cached(self):
+        """Главная для анонима отдаётся из кэша до изменения ленты."""
+        first = self.call(async_views.index)
+        Post.objects.filter(id=self.post.id).update(text='Без сигнала')
+        self.assertEqual(self.call(async_views.index).content, first.content)
+
+    def test_profile_counts_posts_from_author_stats(self):
+        """Как и синхронный профиль, число страниц берётся из AuthorStats."""
+        AuthorStats.objects.filter(user=self.author).update(post_count=25)
+        response = self.call(async_views.profile, 'author')
+        self.assertContains(response, '?page=3')
@@ -0,0 +1,354 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+from itertools import accumulate
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from core import counts
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
+from ..image_worker import render_image
+from ..search import search_posts
+from ..thumbnails import get_thumbnail_url, store_image
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ExplainViewsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def test_explain_uses_feed_indexes(self):
+        """План запросов ленты группы использует составной индекс."""
+        out = StringIO()
+        call_command('explain_views', username='auth', stdout=out)
+        output = out.getvalue()
+        self.assertIn('/follow/ [200]', output)
+        self.assertIn('post_group_pub_date_idx', output)
+        self.assertIn('feed_user_pub_date_idx', output)
+
+
+class RebuildCountersCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Да')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def test_signals_keep_counters(self):
+        """Счётчики обновляются при создании и удалении."""
+        self.post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.author.stats.post_count, 1)
+        self.assertEqual(self.author.stats.follower_count, 1)
+        Follow.objects.filter(user=self.reader).delete()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.follower_count, 0)
+
+    def test_rebuild_fixes_drift(self):
+        """rebuild_counters исправляет разошедшиеся счётчики."""
+        Post.objects.update(comment_count=7)
+        AuthorStats.objects.filter(user=self.author).update(
+            post_count=0, follower_count=5
+        )
+        AuthorStats.objects.filter(user=self.reader).delete()
+        call_command('rebuild_counters', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual((stats.post_count, stats.follower_count), (1, 1))
+        self.assertTrue(AuthorStats.objects.filter(user=self.reader).exists())
+
+
+class TransferCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Старая кошка', group=cls.group
+        )
+        cls.pub_date = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        Post.objects.update(pub_date=cls.pub_date)
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Да')
+        Comment.objects.update(pub_date=cls.pub_date)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def import_data(self, kind, name, **options):
+        out = StringIO()
+        call_command('import_data', kind, self.path(name), stdout=out,
+                     **options)
+        return out.getvalue()
+
+    def test_round_trip_keeps_data_and_derived_rows(self):
+        """После выгрузки и загрузки совпадают данные, счётчики и ленты."""
+        for kind, name in (('posts', 'posts.jsonl'),
+                           ('comments', 'comments.csv'),
+                           ('follows', 'follows.jsonl')):
+            call_command('export_data', kind, output=self.path(name),
+                         chunk_size=1, stderr=StringIO())
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        self.assertEqual(counts.count(Post.objects.all()), (0, True))
+        self.import_data('posts', 'posts.jsonl', batch_size=1)
+        # Закэшированное количество сброшено, хотя сигналов не было.
+        self.assertEqual(counts.count(Post.objects.all()), (1, True))
+        self.import_data('comments', 'comments.csv')
+        output = self.import_data('follows', 'follows.jsonl')
+        self.assertIn('Загружено записей: 1', output)
+        post = Post.objects.get(id=self.post.id)
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(post.comments.get().pub_date, self.pub_date)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.comment_count, 1)
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual((stats.post_count, stats.follower_count), (1, 1))
+        self.assertTrue(post.feed_entries.filter(user=self.reader).exists())
+        self.assertEqual(list(search_posts('кошки')), [post])
+
+    def test_unknown_authors_are_skipped_or_created(self):
+        """Неизвестный автор пропускается, а с --create-missing создаётся."""
+        with open(self.path('new.jsonl'), 'w', encoding='utf-8') as stream:
+            stream.write(json.dumps({'author': 'new', 'text': 'Привет'}))
+        output = self.import_data('posts', 'new.jsonl')
+        self.assertIn('пропущено: 1', output)
+        self.import_data('posts', 'new.jsonl', create_missing=True)
+        post = Post.objects.get(author__username='new')
+        self.assertGreater(post.id, self.post.id)
+        self.assertEqual(post.text, 'Привет')
+        with open(self.path('fan.jsonl'), 'w', encoding='utf-8') as stream:
+            stream.write(json.dumps({'user': 'fan', 'author': 'new'}))
+        self.import_data('follows', 'fan.jsonl', create_missing=True)
+        self.assertTrue(
+            AuthorStats.objects.filter(user__username='fan').exists()
+        )
+        self.assertEqual(post.author.stats.post_count, 1)
+        # Последовательность id сдвинута за импортированные посты.
+        created = Post.objects.create(author=post.author, text='Ещё')
+        self.assertGreater(created.id, post.id)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BenchmarkCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_seed_and_benchmark(self):
+        """Генератор наполняет базу, замер пишет JSON по всем страницам."""
+        call_command(
+            'seed_benchmark', posts=60, users=12, groups=3,
+            image_share=0.5, batch_size=25, stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        self.assertTrue(Follow.objects.exists())
+        popular = AuthorStats.objects.order_by('-follower_count').first()
+        self.assertEqual(
+            popular.follower_count,
+            Follow.objects.filter(author=popular.user).count(),
+        )
+        out = StringIO()
+        call_command('benchmark', requests=2, warmup=0, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['meta']['dataset']['posts'], 60)
+        # Последовательности сдвинуты за явные id генератора.
+        author = User.objects.create_user(username='after_seed')
+        Post.objects.create(author=author, text='После генерации')
+        names = {row['name'] for row in report['results']}
+        self.assertIn('posts:main', names)
+        self.assertIn('users:password_reset_confirm', names)
+        self.assertIn('about:tech', names)
+        self.assertNotIn('posts:profile_follow', names)
+        for row in report['results']:
+            with self.subTest(name=row['name'], user=row['user']):
+                self.assertLess(max(row['status']), 400)
+                self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+                self.assertIsNotNone(row['queries'])
+        out = StringIO()
+        call_command('benchmark_templates', renders=3, warmup=0, stdout=out)
+        report = json.loads(out.getvalue())
+        rows = {row['name']: row for row in report['results']}
+        self.assertEqual(rows['posts:main']['template'], 'posts/index.html')
+        self.assertIn('?q=', rows['posts:search']['url'])
+        for row in report['results']:
+            with self.subTest(name=row['name']):
+                self.assertEqual(row['status'], 200)
+                self.assertEqual(row['renders'], 3)
+                self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+                self.assertEqual(row['render_queries'], 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=small_gif,
+                content_type='image/gif'
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_pregenerate_submits_in_batches(self):
+        """Команда держит в пуле не больше batch_size картинок."""
+        for i in range(4):
+            buffer = BytesIO()
+            Image.new('RGB', (40, 30), (60 * i, 0, 0)).save(buffer, 'PNG')
+            Post.objects.create(
+                author=self.author, text=f'Пост {i}',
+                image=SimpleUploadedFile(f'pic{i}.png', buffer.getvalue()),
+            )
+        events = []
+
+        class Executor(ThreadPoolExecutor):
+            def submit(self, *args, **kwargs):
+                events.append(1)
+                return super().submit(*args, **kwargs)
+
+        def store(*args):
+            events.append(-1)
+            store_image(*args)
+
+        command = 'posts.management.commands.pregenerate_thumbnails'
+        out = StringIO()
+        with mock.patch(f'{command}.create_executor',
+                        return_value=Executor(1)), \
+                mock.patch(f'{command}.store_image', side_effect=store):
+            call_command('pregenerate_thumbnails', batch_size=2, stdout=out)
+        self.assertIn('Обработано картинок: 5, ошибок: 0', out.getvalue())
+        self.assertLessEqual(max(accumulate(events)), 2)
+
+    def test_page_uses_precomputed_thumbnail(self):
+        """Шаблон берёт готовую миниатюру, а до её появления - оригинал."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.assertIsNone(get_thumbnail_url(self.post.image, 'card'))
+        self.assertContains(self.client.get(url), self.post.image.url)
+        store_image(*render_image(self.post.image.name))
+        thumbnail_url = get_thumbnail_url(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail_url)
+        response = self.client.get(url)
+        self.assertContains(response, thumbnail_url)
+        # Варианты для srcset записаны и попали в разметку
+        variant = self.post.image_variants.get(format='webp', width=320)
+        self.assertContains(response, f'{variant.image.url} 320w')
+
+    def test_variants_follow_image_content(self):
+        """Картинки с одним именем файла не делят варианты, а замена
+        картинки убирает старые варианты."""
+        def upload(color):
+            buffer = BytesIO()
+            Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+            return SimpleUploadedFile('pic.png', buffer.getvalue())
+
+        red = Post.objects.create(
+            author=self.author, text='Красная', image=upload('red')
+        )
+        green = Post.objects.create(
+            author=self.author, text='Зелёная', image=upload('green')
+        )
+        for post in (red, green):
+            store_image(*render_image(post.image.name))
+        red_names = set(red.image_variants.values_list('image', flat=True))
+        green_names = set(
+            green.image_variants.values_list('image', flat=True)
+        )
+        self.assertTrue(red_names)
+        self.assertFalse(red_names & green_names)
+        red.image = upload('blue')
+        red.save(update_fields=['image'])
+        self.assertFalse(red.image_variants.exists())
+        store_image(*render_image(red.image.name))
+        self.assertFalse(
+            set(red.image_variants.values_list('image', flat=True))
+            & red_names
+        )
+
+    def test_rerender_deletes_replaced_variant_files(self):
+        """Перерисовка удаляет файлы вариантов, которые заменила."""
+        def png(color):
+            buffer = BytesIO()
+            Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+            return buffer.getvalue()
+
+        post = Post.objects.create(
+            author=self.author, text='Пост',
+            image=SimpleUploadedFile('pic.png', png('red')),
+        )
+
+        def render():
+            with self.captureOnCommitCallbacks(execute=True):
+                store_image(*render_image(post.image.name))
+            return set(post.image_variants.values_list('image', flat=True))
+
+        old_names = render()
+        # Картинку перезаписали под тем же именем.
+        with open(default_storage.path(post.image.name), 'wb') as stream:
+            stream.write(png('green'))
+        new_names = render()
+        self.assertTrue(old_names)
+        self.assertFalse(old_names & new_names)
+        for name in old_names:
+            self.assertFalse(default_storage.exists(name))
+        for name in new_names:
+            self.assertTrue(default_storage.exists(name))
@@ -1,6 +1,7 @@
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-from ..models import Group, Post, User
+from ..models import Follow, Group, Post, User
 
 
 class PostModelTest(TestCase):
@@ -52,3 +53,11 @@ class PostModelTest(TestCase):
         # Получаем из свойста класса Post значение verbose_name для title
         verbose = post._meta.get_field('group').verbose_name
         self.assertEqual(verbose, 'Группа')
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на автора запрещена на уровне БД."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Follow.objects.create(user=reader, author=self.user)
@@ -0,0 +1,161 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Миниатюры всех размеров из THUMBNAIL_PRESETS и варианты для srcset
+(см. image_variants) строятся в пуле локальных процессов сразу после
+загрузки картинки. Процесс-воркер только декодирует и масштабирует
+изображение и пишет файлы в хранилище; ключи sorl-thumbnail и строки
+PostImageVariant записывает родительский процесс. Шаблоны лишь ищут
+готовую миниатюру и никогда не масштабируют картинку в запросе.
+
+PresetBackend и запись миниатюр вызывают приватные методы
+ThumbnailBackend, поэтому версия sorl-thumbnail закреплена в
+requirements.txt.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .cache import purge_post
+from .image_variants import store_variants
+from .image_worker import render_image, setup
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class PresetBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет искать миниатюру, не создавая её."""
+
+    def full_options(self, source, options):
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_for(self, source, geometry, options):
+        name = self._get_thumbnail_filename(
+            source, geometry, self.full_options(source, options)
+        )
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry, options):
+        return default.kvstore.get(
+            self.thumbnail_for(ImageFile(file_), geometry, options)
+        )
+
+
+backend = PresetBackend()
+
+
+def get_thumbnail_url(image, preset):
+    """URL готовой миниатюры или None, если она ещё не построена."""
+    geometry, options = settings.THUMBNAIL_PRESETS[preset]
+    thumbnail = backend.lookup(image, geometry, options)
+    return thumbnail.url if thumbnail else None
+
+
+def render_thumbnails(name):
+    """Строит миниатюры всех пресетов. Выполняется в процессе-воркере."""
+    source = ImageFile(name)
+    source_image = default.engine.get_image(source)
+    try:
+        size = default.engine.get_image_size(source_image)
+        image_info = default.engine.get_image_info(source_image)
+        thumbnails = []
+        for geometry, options in settings.THUMBNAIL_PRESETS.values():
+            options = backend.full_options(source, options)
+            thumbnail = backend.thumbnail_for(source, geometry, options)
+            if thumbnail.exists():
+                thumbnail.set_size()
+            else:
+                options['image_info'] = image_info
+                backend._create_thumbnail(
+                    source_image, geometry, options, thumbnail
+                )
+            thumbnails.append((thumbnail.name, thumbnail.size))
+    finally:
+        default.engine.cleanup(source_image)
+    return name, size, thumbnails
+
+
+def store_thumbnails(name, size, thumbnails):
+    """Регистрирует построенные миниатюры в key-value хранилище sorl."""
+    source = ImageFile(name)
+    source.set_size(size)
+    default.kvstore.get_or_set(source)
+    for thumbnail_name, thumbnail_size in thumbnails:
+        thumbnail = ImageFile(thumbnail_name, default.storage)
+        thumbnail.set_size(thumbnail_size)
+        default.kvstore.set(thumbnail, source)
+
+
+def store_image(name, size, thumbnails, variants):
+    store_thumbnails(name, size, thumbnails)
+    store_variants(name, variants)
+    # Закэшированные страницы постов показывают ещё оригинал.
+    for post in Post.objects.filter(image=name).values_list(
+        'id', 'author__username', 'group__slug'
+    ):
+        purge_post(*post)
+
+
+def create_executor(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=setup,
+    )
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = create_executor(settings.THUMBNAIL_WORKERS)
+        return _executor
+
+
+def _done(name, future):
+    with _lock:
+        _pending.discard(name)
+    try:
+        store_image(*future.result())
+    except Exception:
+        logger.exception('Не удалось построить миниатюры для %s', name)
+
+
+def enqueue_thumbnails(name):
+    """Ставит картинку в очередь на построение миниатюр."""
+    with _lock:
+        if name in _pending:
+            return None
+        _pending.add(name)
+    future = get_executor().submit(render_image, name)
+    future.add_done_callback(lambda done: _done(name, done))
+    return future
+
+
+def schedule_thumbnails(post):
+    """Миниатюры новой картинки строятся в фоне после коммита."""
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(lambda: enqueue_thumbnails(name))
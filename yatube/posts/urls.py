@@ -1,25 +1,34 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Ленты и страница поста: синхронные или async-представления.
+feed_views = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'posts'
 
 urlpatterns = [
-    path('', views.index, name='main'),
+    path('', feed_views.index, name='main'),
     path(
         'profile/<str:username>/',
-        views.profile,
+        feed_views.profile,
         name='profile'
     ),
     path(
         'posts/<int:post_id>/',
-        views.post_detail,
+        feed_views.post_detail,
         name='post_detail'
     ),
     path(
         'group/<slug:slug>/',
-        views.group_posts,
+        feed_views.group_posts,
         name='group'
     ),
+    path(
+        'search/',
+        views.search,
+        name='search'
+    ),
     path(
         'create/',
         views.post_create,
@@ -30,6 +39,11 @@ urlpatterns = [
         views.post_edit,
         name='post_edit'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -37,7 +51,7 @@ urlpatterns = [
     ),
     path(
         'follow/',
-        views.follow_index,
+        feed_views.follow_index,
         name='follow_index'
     ),
     path(
@@ -1,66 +1,171 @@
-from django.core.paginator import Paginator
+from core.cache import cached
+from core.page_cache import add_surrogate_keys
+from core.replicas import use_primary
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from yatube.paginator import get_paginator_page
-
-from .models import Post, Group, Follow, User
+from django.urls import reverse
+from django.utils.http import urlencode
+from yatube.paginator import (
+    COMMENT_ORDERING, CURSOR_PARAM, CursorPaginator, get_cursor_page,
+    get_paginator_page,
+)
+
+from .models import Comment, Post, Group, Follow, User
+from .feed import follow_page
+from .search import search_posts
+from .cache import (
+    author_key, feed_page_key, get_feed_version, group_key, post_keys,
+)
+from .thumbnails import schedule_thumbnails
 from .forms import PostForm, CommentForm
 
-from yatube.settings import POSTS_PER_PAGE
-
 
-def index(request):
-    posts = Post.objects.select_related('group')
+def _render_index(request, feed_version):
+    posts = Post.objects.for_feed()
     page_obj = get_paginator_page(request, posts)
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'feed_version': feed_version,
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, 'posts/index.html', context)
 
 
+def index(request):
+    """Главная страница. Анонимам отдаётся целиком из кэша."""
+    feed_version = get_feed_version()
+    if request.user.is_authenticated:
+        return _render_index(request, feed_version)
+    content = cached(
+        feed_page_key(request),
+        lambda: _render_index(request, feed_version).content,
+        settings.FEED_CACHE_TIMEOUT,
+        version=feed_version,
+    )
+    return HttpResponse(content)
+
+
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.select_related('group').filter(group=group)
+    posts = Post.objects.for_feed().filter(group=group)
     page_obj = get_paginator_page(request, posts)
     context = {
         'group': group,
         'page_obj': page_obj,
         'posts': posts,
     }
-    return render(request, template, context)
+    return add_surrogate_keys(
+        render(request, template, context), group_key(slug)
+    )
+
+
+def search(request):
+    """Поиск по тексту постов: лучшие совпадения первыми."""
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query).for_feed()
+    page_obj = get_cursor_page(request, posts, ordering=('-rank', '-id'))
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'cursor_query': f"{urlencode({'q': query})}&",
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def profile_page(request, author):
+    """Страница постов автора; их число берётся из AuthorStats."""
+    stats = getattr(author, 'stats', None)
+    return get_paginator_page(
+        request, author.posts.for_feed(),
+        count=stats.post_count if stats else None,
+    )
 
 
 def profile(request, username):
     # Здесь код запроса к модели и создание словаря контекста
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
     following = (
         request.user.is_authenticated
-        and user.following.exists()
+        and Follow.objects.filter(user=request.user, author=user).exists()
     )
-    posts = user.posts.all()
-    page_obj = get_paginator_page(request, posts)
     context = {
-        'page_obj': page_obj,
+        'page_obj': profile_page(request, user),
         'author': user,
-        'posts': posts,
+        'posts': user.posts.for_feed(),
         'following': following,
     }
-    return render(request, 'posts/profile.html', context)
+    return add_surrogate_keys(
+        render(request, 'posts/profile.html', context), author_key(username)
+    )
 
 
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related(
+            'author__stats', 'group'
+        ).prefetch_related('image_variants'),
+        id=post_id
+    )
+    comments = get_cursor_page(
+        request,
+        post.comments.select_related('author'),
+        ordering=COMMENT_ORDERING,
+        per_page=settings.COMMENTS_PER_PAGE,
+    )
     context = {
         'post': post,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        # С последней страницы новые комментарии подгружаются скриптом.
+        'newer_cursor': (
+            comments.paginator.cursor_for(comments[-1]) if comments else ''
+        ),
     }
-    return render(request, 'posts/post_detail.html', context)
+    keys = post_keys(
+        post.id, post.author.username,
+        post.group.slug if post.group_id else None,
+    )
+    return add_surrogate_keys(
+        render(request, 'posts/post_detail.html', context), *keys
+    )
 
 
+def post_comments(request, post_id):
+    """Комментарии после курсора в JSON, для подгрузки новых."""
+    get_object_or_404(Post.objects.only('id'), id=post_id)
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        COMMENT_ORDERING,
+    )
+    cursor = request.GET.get(CURSOR_PARAM, '')
+    page = paginator.page(cursor)
+    return JsonResponse({
+        'comments': [
+            {
+                'id': comment.id,
+                'author': comment.author.username,
+                'author_url': reverse(
+                    'posts:profile', args=[comment.author.username]
+                ),
+                'text': comment.text,
+                'pub_date': comment.pub_date.isoformat(),
+            }
+            for comment in page
+        ],
+        # Курсор последнего отданного комментария: с него спрашиваем дальше.
+        'cursor': paginator.cursor_for(page[-1]) if page else cursor,
+        'has_more': page.has_next(),
+    })
+
+
+@use_primary
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -72,11 +177,13 @@ def post_create(request):
         form = form.save(commit=False)
         form.author = request.user
         form.save()
+        schedule_thumbnails(form)
         return redirect(f'/profile/{request.user}/')
     form = PostForm()
     return render(request, template, {'form': form})
 
 
+@use_primary
 @login_required
 def post_edit(request, post_id):
     template_name = 'posts/create_post.html'
@@ -88,7 +195,11 @@ def post_edit(request, post_id):
     )
     if post.author == request.user:
         if form.is_valid():
-            post = form.save()
+            post = form.save(commit=False)
+            # Не перезаписываем счётчик, который меняется через F().
+            post.save(update_fields=['text', 'group', 'image'])
+            if 'image' in form.changed_data:
+                schedule_thumbnails(post)
             return redirect('posts:post_detail', post_id)
         return render(request,
                       template_name,
@@ -96,6 +207,7 @@ def post_edit(request, post_id):
     return redirect('posts:post_detail', post_id)
 
 
+@use_primary
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -111,30 +223,25 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     """Страница с авторами на которых подписаны."""
-    follow_posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(follow_posts, POSTS_PER_PAGE)
-    page_obj = get_paginator_page(request, follow_posts)
+    page_obj = follow_page(request.user, request.GET.get(CURSOR_PARAM))
     context = {
         'page_obj': page_obj,
-        'paginator': paginator,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@use_primary
 @login_required
 def profile_follow(request, username):
     """Делает подписку на автора."""
     author = get_object_or_404(User, username=username)
-    follow = author.following
-    # Follow.objects.filter(
-    #     user=request.user,
-    #     author=author)
-    if request.user != author and not follow.exists():
-        Follow.objects.create(user=request.user,
-                              author=author)
+    # Повторная подписка отсекается уникальным ограничением unique_follow.
+    if request.user != author:
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username)
 
 
+@use_primary
 @login_required
 def profile_unfollow(request, username):
     """Делает отписку от автора."""
@@ -0,0 +1,18 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server, e.g. ``uvicorn yatube.asgi:application``;
+set YATUBE_ASYNC_VIEWS=1 to serve the feeds with the async views.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = get_asgi_application()
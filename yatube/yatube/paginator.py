@@ -1,8 +1,319 @@
-from django.core.paginator import Paginator
-from yatube.settings import POSTS_PER_PAGE
+import base64
+import json
+import math
+from collections.abc import Sequence
+from datetime import date
 
+from core import counts
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-def get_paginator_page(request, query_set):
-    paginator = Paginator(query_set, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+from yatube.settings import PAGE_WINDOW, POSTS_PER_PAGE
+
+CURSOR_PARAM = 'cursor'
+# ?page=last - единственный случай, когда нужен точный COUNT(*).
+LAST_PAGE = 'last'
+FEED_ORDERING = ('-pub_date', '-id')
+# Комментарии читаются от старых к новым.
+COMMENT_ORDERING = ('pub_date', 'id')
+
+
+def encode_cursor(values, direction='next'):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    values = [
+        value.isoformat() if isinstance(value, date) else value
+        for value in values
+    ]
+    raw = json.dumps([direction[0], values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (направление, значения) или None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации без номера и общего количества."""
+    cursor_paginated = True
+    number = None
+
+    def __init__(self, object_list, paginator, cursor=None,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page {self.cursor or "first"}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация: WHERE (pub_date, id) < курсор вместо OFFSET.
+
+    Не выполняет COUNT(*), стоимость страницы не зависит от её глубины.
+    Все поля ordering должны сортироваться в одном направлении.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        self.object_list = object_list.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.descending = ordering[0].startswith('-')
+
+    def cursor_for(self, obj, direction='next'):
+        return encode_cursor(
+            [getattr(obj, name) for name in self.fields], direction
+        )
+
+    def _to_python(self, values):
+        model = self.object_list.model
+        converted = []
+        for name, value in zip(self.fields, values):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Аннотация (например, ранг поиска) - берём как есть.
+                converted.append(value)
+            else:
+                converted.append(field.to_python(value))
+        return converted
+
+    def _beyond(self, values, forward, fields=None):
+        lookup = 'lt' if self.descending == forward else 'gt'
+        fields = fields or self.fields
+        condition = Q()
+        for i, name in enumerate(fields):
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(fields[:i], values[:i]):
+                step &= Q(**{prev_name: prev_value})
+            condition |= step
+        return condition
+
+    def _reverse(self, ordering):
+        return [
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in ordering
+        ]
+
+    def _rows(self, values=None, forward=True):
+        """До per_page + 1 объектов за курсором в порядке обхода."""
+        query_set = self.object_list
+        if values is not None:
+            query_set = query_set.filter(self._beyond(values, forward))
+        if not forward:
+            query_set = query_set.order_by(*self._reverse(self.ordering))
+        return list(query_set[:self.per_page + 1])
+
+    def _fetch(self, values=None, forward=True):
+        items = self._rows(values, forward)
+        return items[:self.per_page], len(items) > self.per_page
+
+    def page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is not None and len(decoded[1]) != len(self.fields):
+            decoded = None
+        if decoded is not None:
+            try:
+                values = self._to_python(decoded[1])
+            except (ValidationError, TypeError, ValueError):
+                decoded = None
+        if decoded is None:
+            items, has_more = self._fetch()
+            return CursorPage(
+                items, self,
+                next_cursor=(
+                    self.cursor_for(items[-1]) if has_more else None
+                ),
+            )
+        if decoded[0] == 'n':
+            items, has_more = self._fetch(values)
+            return CursorPage(
+                items, self, cursor=cursor,
+                next_cursor=(
+                    self.cursor_for(items[-1]) if has_more else None
+                ),
+                previous_cursor=(
+                    self.cursor_for(items[0], 'previous') if items else None
+                ),
+            )
+        items, has_more = self._fetch(values, forward=False)
+        items.reverse()
+        return CursorPage(
+            items, self, cursor=cursor,
+            next_cursor=self.cursor_for(items[-1]) if items else None,
+            previous_cursor=(
+                self.cursor_for(items[0], 'previous') if has_more else None
+            ),
+        )
+
+
+def get_cursor_page(request, query_set, ordering=FEED_ORDERING,
+                    per_page=POSTS_PER_PAGE):
+    paginator = CursorPaginator(query_set, per_page, ordering)
+    return paginator.page(request.GET.get(CURSOR_PARAM))
+
+
+class FeedPage(Page):
+    @cached_property
+    def next_cursor(self):
+        """Курсор для перехода "Следующая" без OFFSET."""
+        if not self.has_next():
+            return None
+        return self.paginator.cursor_paginator.cursor_for(
+            self[len(self) - 1]
+        )
+
+    @cached_property
+    def page_range(self):
+        """Первая страница, окно вокруг текущей и последняя.
+
+        Пропуски обозначены Paginator.ELLIPSIS. Пока точное количество
+        не известно, последняя страница заменяется пропуском.
+        """
+        paginator = self.paginator
+        start = max(1, self.number - paginator.window)
+        end = min(paginator.num_pages, self.number + paginator.window)
+        pages = []
+        if start > 1:
+            pages.append(1)
+        if start > 2:
+            pages.append(paginator.ELLIPSIS)
+        pages.extend(range(start, end + 1))
+        if not paginator.count_is_exact:
+            pages.append(paginator.ELLIPSIS)
+            return pages
+        if end < paginator.num_pages - 1:
+            pages.append(paginator.ELLIPSIS)
+        if end < paginator.num_pages:
+            pages.append(paginator.num_pages)
+        return pages
+
+
+class FeedPaginator(Paginator):
+    """Нумерованная пагинация, страницы которой умеют выдать курсор.
+
+    Для показа страницы не нужен COUNT(*) всей выборки: page() считает
+    объекты только до конца окна после запрошенной страницы. Если их
+    меньше, это и есть точное количество, иначе оно берётся из
+    core.counts - закэшированное или оценка планировщика. count, если
+    его не передали (например, из AuthorStats), считается лениво и тоже
+    через кэш.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING,
+                 window=PAGE_WINDOW, count=None):
+        self.cursor_paginator = CursorPaginator(
+            object_list, per_page, ordering
+        )
+        self.window = window
+        self.estimated_count = 0
+        super().__init__(object_list.order_by(*ordering), per_page)
+        if count is not None:
+            self.count = self.estimated_count = count
+
+    @cached_property
+    def count(self):
+        return counts.exact_count(self.object_list)
+
+    @property
+    def count_is_exact(self):
+        # count - cached_property: посчитанное значение лежит в __dict__.
+        return 'count' in self.__dict__
+
+    def _pages(self, count):
+        if count == 0 and not self.allow_empty_first_page:
+            return 0
+        return math.ceil(max(1, count - self.orphans) / self.per_page)
+
+    @property
+    def num_pages(self):
+        """Число страниц; без точного count - не меньше стольких."""
+        if self.count_is_exact:
+            return self._pages(self.count)
+        return self._pages(self.estimated_count)
+
+    def probe(self, number):
+        """Считает объекты до конца окна после страницы number.
+
+        Оценка планировщика может быть сильно завышена (устаревшая
+        статистика после удалений), поэтому проба не пропускается, даже
+        если оценка больше окна: она только верхняя граница для показа.
+        """
+        limit = (number + self.window) * self.per_page + 1
+        if self.count_is_exact:
+            return
+        found = self.object_list[:limit].count()
+        if found < limit:
+            self.count = self.estimated_count = found
+            return
+        total, exact = counts.count(self.object_list)
+        if exact and total >= found:
+            self.count = total
+        self.estimated_count = max(total, found)
+
+    def validate_number(self, number):
+        if number == LAST_PAGE:
+            if not self.count_is_exact:
+                self.count = counts.exact_count(self.object_list)
+            self.estimated_count = self.count
+            return self._pages(self.count)
+        try:
+            self.probe(max(1, int(number)))
+        except (TypeError, ValueError):
+            pass
+        return super().validate_number(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_exact:
+            return super().page(number)
+        # За страницей есть ещё целое окно, обрезать её по count не нужно.
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+    def _get_page(self, *args, **kwargs):
+        return FeedPage(*args, **kwargs)
+
+
+def get_paginator_page(request, query_set, ordering=FEED_ORDERING,
+                       count=None):
+    """Страница ленты: по курсору, если он передан, иначе по номеру.
+
+    count - известное количество постов, например из счётчика автора.
+    """
+    if request.GET.get(CURSOR_PARAM):
+        return get_cursor_page(request, query_set, ordering)
+    paginator = FeedPaginator(
+        query_set, POSTS_PER_PAGE, ordering, count=count
+    )
+    return paginator.get_page(request.GET.get('page'))
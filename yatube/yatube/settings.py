@@ -11,21 +11,33 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
+# Профиль настроек: development (по умолчанию) или production.
+# Production выключает DEBUG и debug_toolbar, берёт ключ и хосты из
+# окружения, держит соединения с базой открытыми и настраивает SQLite.
+SETTINGS_PROFILE = os.environ.get('YATUBE_SETTINGS_PROFILE', 'development')
+PRODUCTION = SETTINGS_PROFILE == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'iq2nufai#0thxr)8^%fh*vmgro#i^#stv22s@qfz*nk9tq9b(^'
+if PRODUCTION:
+    SECRET_KEY = os.environ['YATUBE_SECRET_KEY']
+else:
+    SECRET_KEY = 'iq2nufai#0thxr)8^%fh*vmgro#i^#stv22s@qfz*nk9tq9b(^'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
-ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver', '[::1]']
+if PRODUCTION:
+    ALLOWED_HOSTS = os.environ.get('YATUBE_ALLOWED_HOSTS', '').split(',')
+else:
+    ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver', '[::1]']
 
 
 # Application definition
@@ -42,20 +54,27 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.SamplingProfilerMiddleware',
+    'core.middleware.PageCacheMiddleware',
+    'core.middleware.AnonymousFastPathMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if not PRODUCTION:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -65,7 +84,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,24 +98,86 @@ TEMPLATES = [
         },
     },
 ]
+# В production шаблоны компилируются один раз на процесс и дальше берутся
+# из памяти; в разработке читаются заново, чтобы правки были видны сразу.
+if PRODUCTION:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+ASGI_APPLICATION = 'yatube.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# В production соединение живёт CONN_MAX_AGE секунд и переиспользуется
+# запросами потока; в начале запроса оно проверяется (CONN_HEALTH_CHECKS,
+# см. core/database.py) и при обрыве переоткрывается.
+CONN_MAX_AGE = 600 if PRODUCTION else 0
+CONN_HEALTH_CHECKS = PRODUCTION
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
     }
 }
 
+# PRAGMA для каждого нового соединения с SQLite. WAL позволяет читать
+# во время записи, synchronous=NORMAL в WAL не теряет согласованность,
+# busy_timeout ждёт блокировку вместо мгновенной ошибки.
+if PRODUCTION:
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'busy_timeout': 5000,
+    }
+else:
+    SQLITE_PRAGMAS = {}
+
+# Реплики только для чтения: пути к файлам SQLite через запятую в
+# YATUBE_DB_REPLICAS. Локально их наполняет команда sync_replicas.
+# Читают с реплик GET-представления из REPLICA_VIEW_MODULES, а клиент,
+# который что-то записал, REPLICA_PIN_SECONDS секунд читает с default.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+    filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')), 1
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_VIEW_MODULES = ('posts.views', 'posts.async_views', 'about.views')
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = 10
+
+# Первичные ключи остаются 32-битными, как в существующих миграциях.
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
+# Пользователь запроса и сессия читаются из кэша (core/auth.py,
+# core/sessions.py), изменения сессий пишутся в базу пачками не чаще
+# раза в SESSION_WRITE_BEHIND_SECONDS (задаётся вместе с CACHES).
+AUTHENTICATION_BACKENDS = ['core.auth.CachedModelBackend']
+USER_CACHE_TIMEOUT = 60 * 15
+SESSION_ENGINE = 'core.sessions'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -142,14 +223,132 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+# Сколько номеров страниц показывать по обе стороны от текущей.
+PAGE_WINDOW = 3
+
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подтягиваются при чтении ленты подписок.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_FANOUT_BATCH_SIZE = 500
+
+# Размеры миниатюр картинок постов: имя -> (геометрия, опции sorl).
+# Строятся заранее фоновым пулом процессов, см. posts/thumbnails.py.
+THUMBNAIL_PRESETS = {
+    'card': ('960x539', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_WORKERS = 2
+
+# Варианты картинки поста для srcset: ширины и форматы в порядке
+# предпочтения. Форматы, которые не умеет сохранять Pillow, пропускаются.
+POST_IMAGE_WIDTHS = (320, 640, 960, 1280)
+POST_IMAGE_ASPECT = (960, 539)
+POST_IMAGE_FORMATS = ('avif', 'webp')
+POST_IMAGE_QUALITY = 70
+
+# Кэш главной страницы сбрасывается сигналами, TTL - страховка.
+FEED_CACHE_TIMEOUT = 60 * 15
+
+# Срок жизни токена API (posts/api.py).
+API_TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+
+# Ленты и страница поста отдаются async-представлениями из
+# posts/async_views.py. Включать под ASGI-сервером (yatube.asgi).
+ASYNC_VIEWS = os.environ.get('YATUBE_ASYNC_VIEWS') == '1'
+
+# Анонимные GET к этим страницам обходят сессии, CSRF и сообщения
+# (core.middleware.AnonymousFastPathMiddleware) и отдаются с
+# Cache-Control: public на ANONYMOUS_CACHE_SECONDS секунд.
+ANONYMOUS_FAST_PATH_VIEWS = {
+    'posts:main', 'posts:group', 'posts:profile', 'posts:post_detail',
+    'about:author', 'about:tech',
+}
+ANONYMOUS_CACHE_SECONDS = 60
+
+# Страницы анонимов с суррогатными ключами хранятся в кэше до
+# PAGE_CACHE_SECONDS и сбрасываются сигналами по ключам post:<id>,
+# group:<slug>, author:<username> (core/page_cache.py). Ключи также
+# пересылаются POST-запросом на адреса из YATUBE_PURGE_URLS, например
+# кэширующему прокси или /purge/ другого экземпляра сайта.
+PAGE_CACHE_SECONDS = 60 * 10
+PAGE_CACHE_PURGE_URLS = list(
+    filter(None, os.environ.get('YATUBE_PURGE_URLS', '').split(','))
+)
+PURGE_ALLOWED_IPS = ['127.0.0.1']
+
+# Метрики запросов (core/metrics.py): /metrics отдаётся только с этих
+# адресов, запросы дольше SLOW_REQUEST_SECONDS пишутся в лог core.metrics.
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+SLOW_REQUEST_SECONDS = 0.5
+
+# Выборочный профилировщик (core/profiling.py): доля профилируемых
+# запросов и период снятия стеков. Стеки выгружаются из /profiling/.
+PROFILE_SAMPLE_RATE = float(os.environ.get('YATUBE_PROFILE_RATE', 0))
+PROFILE_INTERVAL = 0.005
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кэш двухуровневый (core/cache.py): L1 в памяти процесса живёт
+# CACHE_LOCAL_TIMEOUT секунд, L2 общий для всех воркеров. L2 задаётся
+# YATUBE_CACHE: locmem (по умолчанию в разработке, живёт в одном
+# процессе), file (каталог YATUBE_CACHE_LOCATION) или memcached (адрес
+# YATUBE_CACHE_LOCATION, нужен pymemcache).
+# Блокировки cached(), счётчики версий, сброс кэша страниц и отложенная
+# запись сессий держатся на атомарных add() и incr() общего L2. У locmem
+# и file они атомарны и видны только внутри процесса, поэтому
+# production работает только с memcached.
+SHARED_CACHE = os.environ.get(
+    'YATUBE_CACHE', 'memcached' if PRODUCTION else 'locmem'
+)
+if PRODUCTION and SHARED_CACHE != 'memcached':
+    raise ImproperlyConfigured(
+        f'YATUBE_CACHE={SHARED_CACHE} не общий для воркеров, '
+        'в production нужен memcached.'
+    )
+SHARED_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+SHARED_CACHE_LOCATIONS = {
+    'locmem': 'shared',
+    'file': os.path.join(tempfile.gettempdir(), 'yatube-cache'),
+    'memcached': '127.0.0.1:11211',
+}
+CACHE_LOCAL_TIMEOUT = 1
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'OPTIONS': {
+            'LOCAL': 'local',
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': CACHE_LOCAL_TIMEOUT,
+        },
+    },
+    'local': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
-} 
+        'LOCATION': 'local',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKENDS[SHARED_CACHE],
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', SHARED_CACHE_LOCATIONS[SHARED_CACHE]
+        ),
+    },
+}
+# Отложенная запись сессий только с общим L2: с кэшем в памяти
+# процесса другие воркеры читали бы из базы старую сессию.
+SESSION_WRITE_BEHIND_SECONDS = 5 if SHARED_CACHE == 'memcached' else None
+# Сколько устаревшее значение cached() ещё отдаётся, пока его
+# пересчитывает другой процесс, и на сколько берётся блокировка.
+CACHE_STALE_SECONDS = 60
+CACHE_LOCK_SECONDS = 10
+# Количества строк для пагинации (core/counts.py): сколько живёт
+# закэшированный COUNT(*) и с какого размера выборки вместо него
+# берётся оценка планировщика.
+COUNT_CACHE_SECONDS = 30
+COUNT_ESTIMATE_MIN = 100000
@@ -20,10 +20,12 @@ from django.conf.urls.static import static
 
 urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
+    path('api/v1/', include('posts.api_urls', namespace='api')),
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('', include('core.urls', namespace='core')),
 ]
 
 handler403 = 'core.views.page_not_found'